@@ -1,55 +1,119 @@
-from flask import Flask, request, jsonify, render_template, session, send_file
+import time
+
+_startup_marks = [("start", time.perf_counter())]  # see "Startup report" at the end
+
+from flask import Flask, request, jsonify, render_template, session, g, stream_with_context, send_from_directory
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.datastructures import MultiDict
+from werkzeug.wsgi import wrap_file
+import csv
+import gc
+import io
 import json
 import random
 import os
 import math
+import multiprocessing
 import re
-from io import BytesIO
-import fitz  # PyMuPDF
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qsl
+
+import click
+import numpy as np
+
+from assets import build_assets, load_manifest, list_outputs, pick_encoding, guess_mimetype, COMPRESSIBLE
+from content import ContentStore
+from convo_state import (
+    ConversationState, make_state_store,
+    QUIZ_ACTIVE, AWAITING_QUIZ_PICK, AWAITING_TOPIC_PICK, AWAITING_FORMULA_CHOICE,
+)
+from intent_index import IntentIndex
+from metrics import Registry
+from pdf_search import SlideSearchIndex, index_pdf
+from quiz_engine import compile_quiz, question_index, quiz_length
+from router import ChatRouter, ChatContext
+from render_pool import RenderPool, RenderBusy, RenderTimeout
+from resistor_net import NetworkError, evaluate_network, evaluate_networks, looks_like_network
+try:
+    from shared_cache import BlobSlice, SharedSlideCache  # needs fcntl (not on Windows)
+except ImportError:
+    BlobSlice = SharedSlideCache = None
+from slides import (
+    SlideCache, slide_key, slide_etag, warm_slides,
+    bundle_key, render_page_timed, render_bundle_timed, parse_page_list, format_page_list,
+    BUNDLE_COLUMNS, BUNDLE_MAX_COLUMNS, BUNDLE_MAX_PAGES, BUNDLE_TILE_WIDTH,
+    clamp_resolution, negotiate_format, fitz_loaded, MIMETYPES, DEFAULT_DPI, DEFAULT_FORMAT, FORMATS,
+    THUMB_WIDTH, WIDTH_CHOICES,
+)
+
+_startup_marks.append(("imports", time.perf_counter()))
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev_secret_key_change_me")
 
+# ------------------- Metrics (/metrics, off unless METRICS_ENABLED=1) -------------------
+metrics = Registry(enabled=os.environ.get("METRICS_ENABLED") == "1")
+HTTP_SECONDS = metrics.histogram("http_request_seconds", "Request latency by route.", ("route", "method"))
+HTTP_RESPONSES = metrics.counter("http_responses_total", "Responses by route and status.", ("route", "status"))
+CHAT_BRANCH_SECONDS = metrics.histogram("chat_branch_seconds", "/chat latency by handling branch.", ("branch",))
+INTENT_MATCH_SECONDS = metrics.histogram("intent_match_seconds", "_match_intent time by deciding stage.", ("stage",))
+SESSION_SECONDS = metrics.histogram("session_seconds", "Cookie session decode/sign time.", ("op",))
+SLIDE_CACHE_LOOKUPS = metrics.counter("slide_cache_lookups_total", "Slide cache lookups.", ("result",))
+RENDER_STAGE_SECONDS = metrics.histogram("slide_render_stage_seconds", "Slide render time by stage.", ("kind", "stage"))
+RENDER_REJECTED = metrics.counter("slide_render_rejected_total", "Renders refused by the render pool.", ("reason",))
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        with SESSION_SECONDS.timer("open"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with SESSION_SECONDS.timer("save"):
+            return super().save_session(app, session, response)
+
+if metrics.enabled:
+    app.session_interface = TimedSessionInterface()
+
+@app.before_request
+def _start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    if metrics.enabled and "request_started" in g:
+        elapsed = time.perf_counter() - g.request_started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.observe(elapsed, route, request.method)
+        HTTP_RESPONSES.inc(route, str(response.status_code))
+        if "chat_branch" in g:
+            CHAT_BRANCH_SECONDS.observe(elapsed, g.chat_branch)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if not metrics.enabled:
+        return "Not found", 404
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def _branch(name: str):
+    # labels which chat() branch handled the message (for chat_branch_seconds)
+    if metrics.enabled:
+        g.chat_branch = name
+
 # ------------------- Base directory -------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# ------------------- Load intents.json safely -------------------
+# ------------------- Content files -------------------
 INTENTS_PATH = os.path.join(BASE_DIR, "intents.json")
-with open(INTENTS_PATH, "r", encoding="utf-8") as f:
-    intents_file = json.load(f)
-
-intents = intents_file.get("intents", [])
-noanswer_intent = next(
-    (i for i in intents if i.get("tag") == "noanswer"),
-    {"responses": ["Sorry, I didn't understand."]}
-)
-
-# ------------------- Load circuits.json (series/parallel) -------------------
 CIRCUITS_PATH = os.path.join(BASE_DIR, "circuits.json")
-try:
-    with open(CIRCUITS_PATH, "r", encoding="utf-8") as f:
-        circuits_data = json.load(f)
-except Exception:
-    circuits_data = {}
-
-# ------------------- Load QUIZ.json safely -------------------
 QUIZ_FILENAME = "QUIZ.json"
 QUIZ_PATH = os.path.join(BASE_DIR, QUIZ_FILENAME)
 
-quiz_data = {}
-quiz_menu = {}
-quiz_error = None
-
-try:
-    with open(QUIZ_PATH, "r", encoding="utf-8") as f:
-        quiz_file = json.load(f)
-    quiz_data = quiz_file.get("quizzes", {})
-    quiz_menu = quiz_file.get("quiz_menu", {})
-except FileNotFoundError:
-    quiz_error = f"{QUIZ_FILENAME} not found in repo root."
-except json.JSONDecodeError as e:
-    quiz_error = f"{QUIZ_FILENAME} is not valid JSON: {e}"
-
 # ------------------- Topic menu -------------------
 TOPIC_MENU = {
     "1": "analog signals",
@@ -102,23 +166,26 @@ NO_WORDS = {"no", "n", "nope", "nah"}
 FORMULA_PROMPT = "\n\n📘 Would you like to learn more? (yes / no)"
 COMMAND_FOOTER = '\n\nType "/topic" to continue or type "tips" to see the available commands.'
 
-def set_formula_state(key: str):
-    session["awaiting_formula_choice"] = True
-    session["last_formula_key"] = key
+def set_formula_state(state: ConversationState, key: str):
+    state.set(AWAITING_FORMULA_CHOICE)
+    state.last_formula_key = key
 
-def clear_formula_state():
-    session.pop("awaiting_formula_choice", None)
-    session.pop("last_formula_key", None)
+def clear_formula_state(state: ConversationState):
+    state.set(AWAITING_FORMULA_CHOICE, False)
+    state.last_formula_key = None
 
-def clear_state():
-    session.pop("quiz_active", None)
-    session.pop("quiz_category", None)
-    session.pop("quiz_index", None)
-    session.pop("quiz_correct", None)
-    session.pop("quiz_answered", None)
-    session.pop("awaiting_quiz_pick", None)
-    session.pop("awaiting_topic_pick", None)
-    clear_formula_state()
+def clear_state(state: ConversationState):
+    state.flags = 0
+    state.quiz_category = None
+    state.quiz_index = None
+    state.quiz_correct = 0
+    state.quiz_answered = 0
+    state.quiz_seed = None
+    clear_formula_state(state)
+
+# Conversation state: "cookie" (default), "memory" (single worker only) or
+# "sqlite" (shared by all workers on the host, CONVO_STATE_DB).
+state_store = make_state_store(os.environ.get("CONVO_STATE_STORE"), os.environ.get("CONVO_STATE_DB"))
 
 # ------------------- Text normalization + safe matching -------------------
 def normalize_text(s: str) -> str:
@@ -130,33 +197,141 @@ def normalize_text(s: str) -> str:
 def has_term(text: str, term: str) -> bool:
     return re.search(rf"\b{re.escape(term)}\b", text) is not None
 
+# ------------------- Content store (hot-reloadable) -------------------
+INTENT_FUZZY_THRESHOLD = float(os.environ.get("INTENT_FUZZY_THRESHOLD", 0.45))
+
+def build_content(parsed: dict):
+    # Builds one immutable snapshot from the parsed JSON files. On the first
+    # load a file may be an exception instead; reloads reject it before this.
+    intents_file = parsed["intents"]
+    if isinstance(intents_file, Exception):
+        raise intents_file
+    if not isinstance(intents_file, dict) or not isinstance(intents_file.get("intents", []), list):
+        raise ValueError("intents.json must be an object with an 'intents' list")
+    intents = intents_file.get("intents", [])
+    noanswer_intent = next(
+        (i for i in intents if i.get("tag") == "noanswer"),
+        {"responses": ["Sorry, I didn't understand."]}
+    )
+
+    circuits_data = parsed["circuits"]
+    if isinstance(circuits_data, Exception):
+        circuits_data = {}
+    if not isinstance(circuits_data, dict):
+        raise ValueError("circuits.json must be an object")
+    for c in circuits_data.values():
+        if isinstance(c, dict) and isinstance(c.get("formula_images"), list):
+            c["formula_images"] = [static_asset_url(u) for u in c["formula_images"]]
+
+    quiz_data = {}
+    quiz_menu = {}
+    quiz_error = None
+    quiz_file = parsed["quiz"]
+    if isinstance(quiz_file, FileNotFoundError):
+        quiz_error = f"{QUIZ_FILENAME} not found in repo root."
+    elif isinstance(quiz_file, json.JSONDecodeError):
+        quiz_error = f"{QUIZ_FILENAME} is not valid JSON: {quiz_file}"
+    elif isinstance(quiz_file, Exception):
+        raise quiz_file
+    else:
+        quiz_data = quiz_file.get("quizzes", {})
+        quiz_menu = quiz_file.get("quiz_menu", {})
+        if not isinstance(quiz_data, dict):
+            raise ValueError(f"{QUIZ_FILENAME} 'quizzes' must be an object")
+
+    quiz = compile_quiz(quiz_data)
+    for problem in quiz.problems:
+        app.logger.warning(f"{QUIZ_FILENAME}: skipped {problem}")
+
+    # Menu order, then any category the menu leaves out; the conversation
+    # state keeps a quiz's category as its position here (see start_quiz_state).
+    menu = quiz_menu if isinstance(quiz_menu, dict) else {}
+    quiz_categories = [menu[k] for k in sorted(menu, key=lambda x: int(x)) if menu[k] in quiz_data]
+    quiz_categories += [k for k in sorted(quiz_data) if k not in quiz_categories]
+
+    return SimpleNamespace(
+        catalog=build_catalog(circuits_data, quiz_data, quiz_menu, quiz),
+        intents=intents,
+        noanswer_intent=noanswer_intent,
+        intent_index=IntentIndex(intents, normalize_text, fuzzy_threshold=INTENT_FUZZY_THRESHOLD),
+        circuits_data=circuits_data,
+        quiz_data=quiz_data,
+        quiz=quiz,
+        quiz_menu=quiz_menu,
+        quiz_categories=tuple(quiz_categories),
+        quiz_error=quiz_error,
+    )
+
+content_store = ContentStore(
+    {"intents": INTENTS_PATH, "circuits": CIRCUITS_PATH, "quiz": QUIZ_PATH},
+    build_content,
+    poll_interval=float(os.environ.get("CONTENT_RELOAD_INTERVAL", 5)),
+)
+def content():
+    return content_store.current
+
+@app.before_request
+def _poll_content_files():
+    content_store.poll()
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        return "Not found", 404
+    if request.headers.get("X-Admin-Token") != token:
+        return "Forbidden", 403
+    ok, error = content_store.reload()
+    return jsonify({"ok": ok, "error": error, "version": content_store.version}), (200 if ok else 422)
+
 # ------------------- Bot matcher (intents.json) -------------------
+
+def _intent_reply(intent):
+    responses = intent.get("responses", [])
+    return (random.choice(responses) if responses else "OK."), intent.get("tag", "noanswer")
+
 def _match_intent(user_text: str):
+    started = time.perf_counter()
     user_text = normalize_text(user_text)
+    c = content()
+    intent_index = c.intent_index
+    noanswer_intent = c.noanswer_intent
 
-    pattern_list = []
-    for intent in intents:
-        for pattern in intent.get("patterns", []):
-            p = normalize_text(pattern)
-            if p:
-                pattern_list.append((p, intent))
-    pattern_list.sort(key=lambda x: len(x[0]), reverse=True)
-
-    for pattern_lower, intent in pattern_list:
-        if user_text == pattern_lower:
-            responses = intent.get("responses", [])
-            return (random.choice(responses) if responses else "OK."), intent.get("tag", "noanswer")
+    intent = intent_index.match_exact(user_text)
+    if intent is not None:
+        INTENT_MATCH_SECONDS.observe(time.perf_counter() - started, "exact")
+        return _intent_reply(intent)
 
     if len(user_text) <= 2:
+        INTENT_MATCH_SECONDS.observe(time.perf_counter() - started, "too_short")
         return random.choice(noanswer_intent.get("responses", ["Sorry, I didn't understand."])), "noanswer"
 
-    for pattern_lower, intent in pattern_list:
-        if has_term(user_text, pattern_lower):
-            responses = intent.get("responses", [])
-            return (random.choice(responses) if responses else "OK."), intent.get("tag", "noanswer")
+    intent = intent_index.match_term(user_text)
+    if intent is not None:
+        INTENT_MATCH_SECONDS.observe(time.perf_counter() - started, "term")
+        return _intent_reply(intent)
+
+    # typos like "binry number sytem"
+    intent, _score = intent_index.match_fuzzy(user_text)
+    if intent is not None:
+        INTENT_MATCH_SECONDS.observe(time.perf_counter() - started, "fuzzy")
+        return _intent_reply(intent)
 
+    INTENT_MATCH_SECONDS.observe(time.perf_counter() - started, "noanswer")
     return random.choice(noanswer_intent.get("responses", ["Sorry, I didn't understand."])), "noanswer"
 
+@app.cli.command("score-intents")
+@click.argument("messages_file", type=click.File("r", encoding="utf-8"))
+def score_intents_command(messages_file):
+    """Fuzzy-score logged messages (one per line) and print tag, score, message."""
+    messages = [line.rstrip("\n") for line in messages_file if line.strip()]
+    intent_index = content().intent_index
+    results = intent_index.score_batch([normalize_text(m) for m in messages])
+    for msg, (tag, score) in zip(messages, results):
+        click.echo(f"{tag or '-'}\t{score:.3f}\t{msg}")
+    matched = sum(1 for tag, _s in results if tag)
+    click.echo(f"# {matched}/{len(results)} above threshold {intent_index.fuzzy_threshold}", err=True)
+
 # ------------------- Explain command -------------------
 EXPLAIN_TOPICS = {"ohm", "and", "or", "not", "nand", "nor", "xor"}
 
@@ -169,7 +344,7 @@ def parse_explain_command(msg_clean: str):
     return None
 
 # ------------------- Circuits formatting -------------------
-def format_circuit_text(key: str) -> str:
+def format_circuit_text(key: str, circuits_data: dict) -> str:
     c = circuits_data.get(key)
     if not c:
         return "❌ Circuit topic not found."
@@ -194,64 +369,374 @@ def format_circuit_text(key: str) -> str:
 
     return "\n".join(lines)
 
-# ------------------- Logic gates query -------------------
-def is_logic_gates_query(msg_clean: str) -> bool:
-    s = msg_clean.replace(" ", "")
-    return (
-        msg_clean in {"logic gate", "logic gates"} or
-        s in {"logicgate", "logicgates"} or
-        msg_clean.startswith("logic gate") or
-        msg_clean.startswith("logic gates")
-    )
-
-# ------------------- Analogue electronics query -------------------
-def is_analog_electronics_query(msg_clean: str) -> bool:
-    s = msg_clean.replace(" ", "")
-    return (
-        msg_clean in {"analog electronics", "analogue electronics"} or
-        s in {"analogelectronics", "analogueelectronics"} or
-        msg_clean.startswith("analog") or
-        msg_clean.startswith("analogue")
-    )
-
-# ------------------- Better series/parallel detection -------------------
-def is_series_query(msg_clean: str) -> bool:
-    s = msg_clean.replace(" ", "")
-    return msg_clean in {"series", "series circuit"} or s in {"series", "seriescircuit"} or msg_clean.startswith("series")
+# ------------------- Slide sets served by chat() -------------------
+SLIDE_SETS = {
+    "logic_gates": {
+        "pdf": "logic_gates.pdf",
+        "pages": [p for p in range(41, 57) if p not in {42, 43}],
+        "text": "📘 Logic Gates (Slides 41–57, excluding 42 & 43)",
+    },
+    "analog": {
+        "pdf": "ANALOGUE_ELECTRONICS.pdf",
+        "pages": list(range(1, 13)),
+        "text": "📘 BJT(Bipolar Junction Transistor), (Slides 1–12)",
+    },
+}
 
-def is_parallel_query(msg_clean: str) -> bool:
-    s = msg_clean.replace(" ", "")
-    return msg_clean in {"parallel", "parallel circuit"} or s in {"parallel", "parallelcircuit"} or msg_clean.startswith("parallel")
+# chat.js shows the THUMB_WIDTH variant first, then lets the browser pick a
+# width from the srcset. The thumbnail URL is the srcset's smallest entry, so
+# each render has one URL (and one browser cache entry).
+def slide_width_url(url: str, width: int) -> str:
+    return f"{url}?w={width}&format=auto"
+
+def slide_srcset(url: str) -> str:
+    return ", ".join(f"{slide_width_url(url, w)} {w}w" for w in WIDTH_CHOICES)
+
+def slide_set_reply(name: str, bundle: bool = False) -> dict:
+    s = SLIDE_SETS[name]
+    if bundle:
+        # one contact-sheet image instead of one request per slide
+        return {"type": "chat", "text": s["text"], "images": [slide_bundle_url(name)]}
+    return slide_pages_reply(s["text"], [(s["pdf"], p) for p in s["pages"]])
+
+def slide_pages_reply(text: str, pages) -> dict:
+    # pages: [(pdf name, page number), ...]
+    images = [f"/pdf/{pdf}/page/{p}.png" for pdf, p in pages]
+    return {
+        "type": "chat",
+        "text": text,
+        "images": images,
+        # small-first variants for clients that support them (static/chat.js)
+        "thumbs": [slide_width_url(url, THUMB_WIDTH) for url in images],
+        "srcsets": [slide_srcset(url) for url in images],
+    }
 
 # ------------------- Pages -------------------
 @app.route("/")
 def home():
     return render_template("index.html")
 
+# ------------------- Fingerprinted static assets (/assets) -------------------
+# Built by `flask build-assets` (see assets.py). Until a build exists,
+# asset_url() points at the plain /static/ files.
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+ASSET_DIR = os.path.join(STATIC_DIR, "dist")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+asset_manifest = load_manifest(ASSET_DIR)
+asset_files = list_outputs(ASSET_DIR)
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    hashed = asset_manifest.get(name)
+    return f"/assets/{hashed}" if hashed else f"/static/{name}"
+
+def static_asset_url(url: str) -> str:
+    # "/static/formula_series.png" in circuits.json -> its fingerprinted URL
+    if isinstance(url, str) and url.startswith("/static/"):
+        return asset_url(url[len("/static/"):])
+    return url
+
+@app.route("/assets/<name>")
+def asset(name: str):
+    if name not in asset_files or name.endswith((".gz", ".br")):
+        return "Not found", 404
+    send_name, encoding = pick_encoding(name, asset_files, request.accept_encodings)
+    resp = send_from_directory(ASSET_DIR, send_name, mimetype=guess_mimetype(name), max_age=ASSET_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+        resp.vary.add("Accept-Encoding")
+    return resp
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write content-hashed, precompressed copies of static/ into static/dist/."""
+    global asset_manifest, asset_files
+    asset_manifest = build_assets(STATIC_DIR, ASSET_DIR, log=click.echo)
+    asset_files = list_outputs(ASSET_DIR)
+    click.echo(f"Built {len(asset_manifest)} assets into {ASSET_DIR}")
+
 # ------------------- Serve PDF pages (ANY pdf in /pdfs) as images -------------------
-@app.route("/pdf/<pdf_name>/page/<int:page_num>.png")
-def pdf_page_png(pdf_name: str, page_num: int):
-    if page_num < 1:
-        return "Invalid page", 400
+PDF_DIR = os.path.join(BASE_DIR, "pdfs")
+SLIDE_MAX_AGE = int(os.environ.get("SLIDE_MAX_AGE", 86400))
+
+# SLIDE_CACHE_STORE=shared keeps renders in one mmap'd store per host that
+# every gunicorn worker reads (see shared_cache.py); the default "memory" store
+# is per process, optionally backed by files in SLIDE_CACHE_DIR.
+SLIDE_CACHE_STORE = os.environ.get("SLIDE_CACHE_STORE", "memory").lower()
+
+if SLIDE_CACHE_STORE == "shared" and SharedSlideCache is not None:
+    slide_cache = SharedSlideCache(
+        cache_dir=os.environ.get("SLIDE_SHARED_DIR") or os.path.join(tempfile.gettempdir(), "webchatbot-slides"),
+        max_bytes=int(os.environ.get("SLIDE_SHARED_MB", 256)) * 1024 * 1024,
+    )
+else:
+    slide_cache = SlideCache(
+        max_bytes=int(os.environ.get("SLIDE_CACHE_MB", 64)) * 1024 * 1024,
+        cache_dir=os.environ.get("SLIDE_CACHE_DIR") or None,
+    )
 
+# Renders run in their own process pool; text routes never wait behind them.
+# RENDER_WAITERS request threads per worker may wait on slide renders; keep it
+# below gunicorn's --threads (4 in render.yaml) so /chat and /api always get one.
+render_pool = RenderPool(
+    workers=int(os.environ.get("RENDER_WORKERS", 2)),
+    queue_size=int(os.environ.get("RENDER_QUEUE", 8)),
+    timeout=float(os.environ.get("RENDER_TIMEOUT", 20)),
+    waiters=int(os.environ.get("RENDER_WAITERS", 3)),
+)
+RENDER_RETRY_AFTER = int(os.environ.get("RENDER_RETRY_AFTER", 2))
+
+# Slide keys whose page doesn't exist, so asking again costs no render.
+MISSING_SLIDES_MAX = 1024
+missing_slides = OrderedDict()
+missing_slides_lock = threading.Lock()
+
+def _slide_missing(key) -> bool:
+    with missing_slides_lock:
+        return key in missing_slides
+
+def _remember_missing_slide(key):
+    with missing_slides_lock:
+        missing_slides[key] = True
+        while len(missing_slides) > MISSING_SLIDES_MAX:
+            missing_slides.popitem(last=False)
+
+def _slide_response(data, etag: str, fmt: str, vary_accept: bool = False):
+    if BlobSlice is not None and isinstance(data, BlobSlice):
+        # shared store hit: the server can sendfile() it straight from the cache file
+        resp = app.response_class(wrap_file(request.environ, data), mimetype=MIMETYPES[fmt], direct_passthrough=True)
+        resp.content_length = len(data)
+    else:
+        resp = app.response_class(data, mimetype=MIMETYPES[fmt])
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = SLIDE_MAX_AGE
+    if vary_accept:
+        resp.vary.add("Accept")
+    return resp
+
+def _resolve_pdf(pdf_name: str):
+    # Returns (pdf_path, None) or (None, error response).
     safe_name = os.path.basename(pdf_name)  # security: blocks ../ tricks
-    pdf_path = os.path.join(BASE_DIR, "pdfs", safe_name)
+    pdf_path = os.path.join(PDF_DIR, safe_name)
 
     if not safe_name.lower().endswith(".pdf"):
-        return "Invalid file", 400
+        return None, ("Invalid file", 400)
     if not os.path.exists(pdf_path):
-        return "PDF not found on server", 404
+        return None, ("PDF not found on server", 404)
+    return pdf_path, None
+
+def _image_params(default_res=DEFAULT_DPI, args=None):
+    # ?format=png|jpeg|webp|auto  ?dpi=N  ?w=N  ?thumb=1 (all clamped to allowed values)
+    # args: another URL's query (MultiDict) instead of this request's
+    args = request.args if args is None else args
+    requested_fmt = args.get("format", DEFAULT_FORMAT)
+    fmt = negotiate_format(requested_fmt, request.accept_mimetypes)
+    dpi = args.get("dpi", type=int)
+    width = args.get("w", type=int)
+    thumb = args.get("thumb") in {"1", "true", "yes"}
+    if dpi is None and width is None and not thumb:
+        res = default_res
+    else:
+        res = clamp_resolution(dpi=dpi, width=width, thumb=thumb)
+    return fmt, res, requested_fmt.lower() == "auto"
+
+def _render_unavailable(reason: str):
+    resp = app.response_class(reason, status=503, mimetype="text/plain")
+    resp.headers["Retry-After"] = str(RENDER_RETRY_AFTER)
+    return resp
+
+def _serve_slide(key, fmt: str, vary_accept: bool, kind: str, render_fn, *render_args):
+    # render_fn returns (bytes or None, {stage: seconds}); see slides.render_page_timed
+    etag = slide_etag(key)
+
+    # browser already has this exact render
+    if etag in request.if_none_match:
+        SLIDE_CACHE_LOOKUPS.inc("not_modified")
+        return _slide_response(b"", etag, fmt, vary_accept).make_conditional(request)
+    if _slide_missing(key):
+        SLIDE_CACHE_LOOKUPS.inc("hit")
+        return "Invalid page", 400
+
+    def render():
+        data, stages = render_pool.run(render_fn, *render_args)
+        for stage, seconds in stages.items():
+            RENDER_STAGE_SECONDS.observe(seconds, kind, stage)
+        return data
 
-    with fitz.open(pdf_path) as doc:
-        if page_num > doc.page_count:
-            return "Invalid page", 400
-        page = doc.load_page(page_num - 1)
-        pix = page.get_pixmap(dpi=150)
+    # concurrent misses for one slide render it once; the rest come back "waited"
+    try:
+        data = slide_cache.get(key)
+        if data is not None:
+            result = "hit"
+        else:
+            with render_pool.waiting():
+                data, result = slide_cache.get_or_render(key, render)
+    except RenderBusy:
+        SLIDE_CACHE_LOOKUPS.inc("miss")
+        RENDER_REJECTED.inc("busy")
+        return _render_unavailable("Slide renderer busy, please retry.")
+    except RenderTimeout:
+        SLIDE_CACHE_LOOKUPS.inc("miss")
+        RENDER_REJECTED.inc("timeout")
+        return _render_unavailable("Slide render timed out, please retry.")
+    SLIDE_CACHE_LOOKUPS.inc(result)
+    if data is None:
+        _remember_missing_slide(key)
+        return "Invalid page", 400
+
+    return _slide_response(data, etag, fmt, vary_accept).make_conditional(request)
+
+@app.route("/pdf/<pdf_name>/page/<int:page_num>.png")
+def pdf_page_png(pdf_name: str, page_num: int):
+    if page_num < 1:
+        return "Invalid page", 400
 
-    return send_file(BytesIO(pix.tobytes("png")), mimetype="image/png")
+    pdf_path, error = _resolve_pdf(pdf_name)
+    if error:
+        return error
+
+    fmt, res, vary_accept = _image_params()
+    if fmt is None:
+        return "Invalid format", 400
+
+    key = slide_key(pdf_path, page_num, res, fmt)
+    return _serve_slide(key, fmt, vary_accept, "page", render_page_timed, pdf_path, page_num, res, fmt)
+
+# ------------------- Slide bundles (one contact sheet per slide range) -------------------
+@app.route("/pdf/<pdf_name>/bundle")
+def pdf_bundle(pdf_name: str):
+    pdf_path, error = _resolve_pdf(pdf_name)
+    if error:
+        return error
+
+    pages = parse_page_list(request.args.get("pages", ""))
+    if not pages:
+        return f"Invalid pages (example: 41,44-56, at most {BUNDLE_MAX_PAGES})", 400
+
+    columns = min(max(request.args.get("cols", BUNDLE_COLUMNS, type=int), 1), BUNDLE_MAX_COLUMNS)
+    fmt, res, vary_accept = _image_params(default_res=f"w{BUNDLE_TILE_WIDTH}")
+    if fmt is None:
+        return "Invalid format", 400
+    if not isinstance(res, str):
+        res = clamp_resolution(width=BUNDLE_TILE_WIDTH)
+
+    key = bundle_key(pdf_path, pages, columns, res, fmt)
+    return _serve_slide(key, fmt, vary_accept, "bundle", render_bundle_timed, pdf_path, pages, columns, res, fmt)
+
+def slide_bundle_url(name: str) -> str:
+    s = SLIDE_SETS[name]
+    return f"/pdf/{s['pdf']}/bundle?pages={format_page_list(s['pages'])}&format=auto"
+
+# ------------------- Slide warm-up -------------------
+def slide_warmup_jobs():
+    for s in SLIDE_SETS.values():
+        pdf_path = os.path.join(PDF_DIR, s["pdf"])
+        for p in s["pages"]:
+            # what chat.js requests: the thumbnail, then a srcset width (format=auto)
+            for width in WIDTH_CHOICES:
+                for fmt in ("jpeg", "webp"):
+                    if fmt in FORMATS:
+                        yield pdf_path, p, clamp_resolution(width=width), fmt
+
+@app.cli.command("warm-slides")
+@click.option("--workers", type=int, default=None, help="Render processes (default: CPU count).")
+def warm_slides_command(workers):
+    """Pre-render every slide chat() can return into the slide cache."""
+    if not slide_cache.cache_dir:
+        click.echo("Note: SLIDE_CACHE_DIR is not set (and SLIDE_CACHE_STORE is not shared), renders only live in this process.")
+    stats = warm_slides(slide_cache, slide_warmup_jobs(), workers=workers, log=click.echo)
+    click.echo(
+        f"Rendered {stats['rendered']}, cached {stats['skipped']}, "
+        f"failed {stats['failed']} in {stats['seconds']:.2f}s"
+    )
+
+# With gunicorn --preload this thread runs in the master, so the renders only
+# reach the workers through SLIDE_CACHE_DIR or the shared store.
+def _warm_slides_in_background():
+    workers = int(os.environ.get("SLIDE_WARMUP_WORKERS", 0)) or None
+    threading.Thread(
+        target=warm_slides,
+        args=(slide_cache, list(slide_warmup_jobs())),
+        kwargs={"workers": workers, "log": app.logger.info},
+        daemon=True,
+    ).start()
+
+# (render children spawned under "python app.py" import this file again)
+if os.environ.get("SLIDE_WARMUP") == "1" and multiprocessing.parent_process() is None:
+    _warm_slides_in_background()
+
+# ------------------- Slide search (/search, chat fallback) -------------------
+# Full-text index over every PDF in pdfs/ (see pdf_search.py). The saved file
+# is loaded on first use; PDFs that changed are re-extracted in the background
+# (checked every SEARCH_RELOAD_INTERVAL seconds), with the text extraction
+# itself in the render pool so it never holds a web worker's GIL.
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(BASE_DIR, "pdf_search_index.json.gz"))
+SEARCH_MIN_SCORE = float(os.environ.get("SEARCH_MIN_SCORE", 3.0))
+SEARCH_MIN_COVERAGE = float(os.environ.get("SEARCH_MIN_COVERAGE", 0.6))
+SEARCH_CHAT_SLIDES = int(os.environ.get("SEARCH_CHAT_SLIDES", 3))
+SEARCH_MAX_LIMIT = 50
+SEARCH_INDEX_BUSY_RETRIES = 30
+
+def _index_pdf_in_pool(pdf_path: str) -> dict:
+    for _attempt in range(SEARCH_INDEX_BUSY_RETRIES):
+        try:
+            return render_pool.run(index_pdf, pdf_path)
+        except RenderBusy:
+            time.sleep(RENDER_RETRY_AFTER)  # renders for users go first
+    raise RenderBusy()
+
+slide_search = SlideSearchIndex(
+    PDF_DIR,
+    SEARCH_INDEX_PATH,
+    poll_interval=float(os.environ.get("SEARCH_RELOAD_INTERVAL", 30)),
+    extract=_index_pdf_in_pool,
+)
+
+def _slide_search_reply(user_text: str):
+    # Best-matching slides for a message no intent answered, or None.
+    with INTENT_MATCH_SECONDS.timer("slide_search"):
+        hits = slide_search.search(user_text, limit=SEARCH_CHAT_SLIDES, min_coverage=SEARCH_MIN_COVERAGE)
+    hits = [h for h in hits if h["score"] >= SEARCH_MIN_SCORE]
+    if not hits:
+        return None
+    lines = ["📘 These slides look related:"]
+    for h in hits:
+        lines.append(f"• {h['pdf']} p.{h['page']}" + (f" – {h['title']}" if h["title"] else ""))
+    return slide_pages_reply("\n".join(lines), [(h["pdf"], h["page"]) for h in hits])
+
+@app.route("/search")
+def search():
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), SEARCH_MAX_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not q:
+        return jsonify({"error": "Missing q"}), 400
+
+    hits = slide_search.search(q, limit=limit)
+    for h in hits:
+        h["image"] = f"/pdf/{h['pdf']}/page/{h['page']}.png"
+    return jsonify({"query": q, "results": hits})
+
+@app.cli.command("build-search-index")
+def build_search_index_command():
+    """Index the text of every PDF in pdfs/ (only changed PDFs are re-read)."""
+    started = time.perf_counter()
+    rebuilt = slide_search.refresh(log=click.echo)
+    click.echo(
+        f"Indexed {rebuilt} changed PDF(s); {len(slide_search.docs)} PDFs, "
+        f"{slide_search.n_pages} pages, {len(slide_search.postings)} terms "
+        f"in {time.perf_counter() - started:.2f}s -> {SEARCH_INDEX_PATH}"
+    )
 
 # ------------------- Quiz helpers -------------------
-def format_quiz_menu() -> str:
+def format_quiz_menu(quiz_data: dict, quiz_menu: dict) -> str:
     lines = ["✅ Available quiz categories:"]
     if isinstance(quiz_menu, dict) and quiz_menu:
         for k in sorted(quiz_menu.keys(), key=lambda x: int(x)):
@@ -265,226 +750,430 @@ def format_quiz_menu() -> str:
     lines.append("Reply with a number (example: 1) to start.")
     return "\n".join(lines)
 
-def format_question_text(category: str, q_obj: dict, index_1based: int) -> str:
-    q = q_obj.get("q", "")
-    choices = q_obj.get("choices", [])
-    lines = [f"📘 Quiz: {category}", f"Q{index_1based}. {q}"]
-    for i, c in enumerate(choices, start=1):
-        lines.append(f"{i}) {c}")
-    lines.append("")
-    lines.append("Tip: reply 1–4")
-    return "\n".join(lines)
-
 def is_quiz_answer(msg: str) -> bool:
     if not msg:
         return False
     s = msg.strip()
     return s.isdigit() and 1 <= int(s) <= 4
 
-def get_correct_option_number(q_obj: dict):
-    choices = q_obj.get("choices", [])
-    ans_i = q_obj.get("answer_index", None)
-    try:
-        ans_i = int(ans_i)
-    except Exception:
-        return None
-    if ans_i < 0 or ans_i >= len(choices):
-        return None
-    return str(ans_i + 1)
-
-def start_quiz_state(category: str, q_index_0based: int):
-    session["quiz_active"] = True
-    session["quiz_category"] = category
-    session["quiz_index"] = int(q_index_0based)
-    session["quiz_correct"] = 0
-    session["quiz_answered"] = 0
-
-def grade_quiz_answer(user_msg: str):
-    category = session.get("quiz_category")
-    idx0 = session.get("quiz_index")
-    if not category or category not in quiz_data or idx0 is None:
-        clear_state()
+# Questions come from the compiled bank (quiz_engine.py). QUIZ_SHUFFLE=1 gives
+# each session its own order, stored as one seed; QUIZ_SAMPLE=N asks only N
+# questions per quiz.
+QUIZ_SHUFFLE = os.environ.get("QUIZ_SHUFFLE") == "1"
+QUIZ_SAMPLE = int(os.environ.get("QUIZ_SAMPLE", 0))
+
+def start_quiz_state(state: ConversationState, category: str, q_index_0based: int, seed=None):
+    state.set(QUIZ_ACTIVE)
+    # a small number instead of the name, which was most of the state's bytes
+    state.quiz_category = content().quiz_categories.index(category) + 1
+    state.quiz_index = int(q_index_0based)
+    state.quiz_correct = 0
+    state.quiz_answered = 0
+    state.quiz_seed = seed
+
+def quiz_category_name(stored):
+    # stored: a position from start_quiz_state, or a category name kept by an
+    # older cookie
+    if isinstance(stored, str):
+        return stored
+    categories = content().quiz_categories
+    if isinstance(stored, int) and 1 <= stored <= len(categories):
+        return categories[stored - 1]
+    return None
+
+def grade_quiz_answer(state: ConversationState, user_msg: str):
+    category = quiz_category_name(state.quiz_category)
+    pos = state.quiz_index
+    cat = content().quiz.get(category) if category else None
+    if cat is None or pos is None:
+        clear_state(state)
         return {"type": "chat", "text": "❌ Quiz session lost. Start again with:\n/quiz"}
 
-    questions = quiz_data.get(category, [])
-    if not questions or idx0 < 0 or idx0 >= len(questions):
-        clear_state()
+    length = quiz_length(len(cat), QUIZ_SAMPLE)
+    if pos < 0 or pos >= length:
+        clear_state(state)
         return {"type": "chat", "text": "❌ Quiz question not found. Start again with:\n/quiz"}
 
-    q_obj = questions[idx0]
-    correct_opt = get_correct_option_number(q_obj)
-    if not correct_opt:
-        return {"type": "chat", "text": "❌ This question has no valid 'answer_index' in QUIZ.json."}
-
-    user_opt = user_msg.strip()
-
-    answered = int(session.get("quiz_answered", 0)) + 1
-    correct = int(session.get("quiz_correct", 0))
-    is_correct = (user_opt == correct_opt)
+    idx = question_index(len(cat), pos, state.quiz_seed)
+    answered = state.quiz_answered + 1
+    correct = state.quiz_correct
+    is_correct = user_msg.strip() == str(cat.correct[idx])
     if is_correct:
         correct += 1
 
-    session["quiz_answered"] = answered
-    session["quiz_correct"] = correct
+    state.quiz_answered = answered
+    state.quiz_correct = correct
 
-    explain = (q_obj.get("explain") or "").strip()
-    explain_block = f"\n\nExplanation:\n{explain}" if explain else ""
     status = "✅ Correct!" if is_correct else "❌ Incorrect."
-    next_idx0 = idx0 + 1
+    reply = status + cat.explains[idx]
 
-    if next_idx0 >= len(questions):
+    if pos + 1 >= length:
         percent = (correct / answered) * 100 if answered else 0.0
         grade_line = f"Grade: {correct}/{answered} ({percent:.0f}%)"
-        clear_state()
-        return {"type": "chat", "text": status + explain_block + f"\n\n{grade_line}\n\n🏁 End of quiz."}
-
-    session["quiz_index"] = next_idx0
-    next_q = questions[next_idx0]
-    q_text = format_question_text(category, next_q, next_idx0 + 1)
-    return {"type": "chat", "text": status + explain_block + "\n\n" + q_text}
-
-# ------------------- Chat API -------------------
-@app.route("/chat", methods=["POST"])
-def chat():
-    payload = request.get_json(silent=True) or {}
-    msg = (payload.get("message", "") or "")
-    msg_raw = msg.strip().lower()
-
-    # Clear everything
-    if msg_raw == "/clear":
-        clear_state()
-        return jsonify({"type": "chat", "text": "🧹 Cleared state."})
-
-    # /topic opens topic menu
-    if msg_raw == "/topic":
-        session["awaiting_topic_pick"] = True
-        return jsonify({"type": "chat", "text": format_topic_menu()})
-
-    # /quiz opens quiz menu
-    if msg_raw == "/quiz":
-        if quiz_error and not quiz_data:
-            return jsonify({"type": "chat", "text": f"Quiz error: {quiz_error}"})
-        if not quiz_data:
-            return jsonify({"type": "chat", "text": "No quiz categories found."})
-        session["awaiting_quiz_pick"] = True
-        return jsonify({"type": "chat", "text": format_quiz_menu()})
-
-    msg_clean = normalize_text(msg)
-
-    # picking quiz category
-    if session.get("awaiting_quiz_pick") and msg_clean.isdigit():
-        session["awaiting_quiz_pick"] = False
-        category = quiz_menu.get(msg_clean) if isinstance(quiz_menu, dict) else None
-
-        if not category:
-            keys = sorted(list(quiz_data.keys()))
-            idx = int(msg_clean) - 1
-            category = keys[idx] if 0 <= idx < len(keys) else None
-
-        if not category or category not in quiz_data:
-            return jsonify({"type": "chat", "text": "❌ Invalid selection. Type /quiz to see the menu again."})
-
-        questions = quiz_data.get(category, [])
-        if not questions:
-            clear_state()
-            return jsonify({"type": "chat", "text": f"No questions found in category: {category}."})
-
-        start_quiz_state(category, 0)
-        q_obj = questions[0]
-        return jsonify({"type": "chat", "text": format_question_text(category, q_obj, 1)})
-
-    # quiz active: answer 1-4
-    if session.get("quiz_active") and is_quiz_answer(msg):
-        return jsonify(grade_quiz_answer(msg))
-
-    # explain
-    explain_topic = parse_explain_command(msg_clean)
-    if explain_topic:
-        return jsonify({"type": "explain", "topic": explain_topic})
-
-    # logic gates pdf
-    if is_logic_gates_query(msg_clean):
-        images = [
-            f"/pdf/logic_gates.pdf/page/{p}.png"
-            for p in range(41, 57)
-            if p not in {42, 43}
-        ]
-        session["awaiting_topic_pick"] = False
-        return jsonify({
-            "type": "chat",
-            "text": "📘 Logic Gates (Slides 41–57, excluding 42 & 43)",
-            "images": images
-        })
-
-    # analogue electronics pdf
-    if is_analog_electronics_query(msg_clean):
-        images = [
-            f"/pdf/ANALOGUE_ELECTRONICS.pdf/page/{p}.png"
-            for p in range(1, 13)
-        ]
-        session["awaiting_topic_pick"] = False
-        return jsonify({
-            "type": "chat",
-            "text": "📘 BJT(Bipolar Junction Transistor), (Slides 1–12)",
-            "images": images
-        })
-
-    # series/parallel (works anytime, even after /topic)
-    if is_series_query(msg_clean):
-        set_formula_state("series")
-        return jsonify({"type": "chat", "text": format_circuit_text("series") + FORMULA_PROMPT})
-
-    if is_parallel_query(msg_clean):
-        set_formula_state("parallel")
-        return jsonify({"type": "chat", "text": format_circuit_text("parallel") + FORMULA_PROMPT})
-
-    # formula yes/no
-    if session.get("awaiting_formula_choice"):
-        ans = msg_clean
-
-        if ans in YES_WORDS:
-            key = session.get("last_formula_key")
-            clear_formula_state()
-
-            imgs = []
-            if key and key in circuits_data:
-                imgs = circuits_data[key].get("formula_images", []) or []
-
-            if imgs:
-                return jsonify({"type": "chat", "text": "Here are the formulas:", "images": imgs})
-
-            return jsonify({"type": "chat", "text": "Sorry, currently no formula available."})
+        clear_state(state)
+        return {"type": "chat", "text": reply + f"\n\n{grade_line}\n\n🏁 End of quiz."}
+
+    state.quiz_index = pos + 1
+    next_idx = question_index(len(cat), pos + 1, state.quiz_seed)
+    return {"type": "chat", "text": reply + "\n\n" + cat.question_text(pos + 2, next_idx)}
+
+@app.cli.command("check-quiz")
+def check_quiz_command():
+    """List QUIZ.json entries that were skipped as invalid."""
+    c = content()
+    if c.quiz_error:
+        click.echo(f"Quiz error: {c.quiz_error}")
+    for name, cat in c.quiz.categories.items():
+        click.echo(f"{name}: {len(cat)} questions")
+    for problem in c.quiz.problems:
+        click.echo(f"skipped {problem}")
+    if c.quiz_error or c.quiz.problems:
+        raise SystemExit(1)
+
+# ------------------- Response catalog (rebuilt with each content snapshot) -------------------
+class CachedReply:
+    # A fixed reply plus its pre-serialized body (same bytes jsonify() produces).
+    __slots__ = ("payload", "body")
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.body = app.json.response(payload).get_data()
+
+def build_catalog(circuits_data: dict, quiz_data: dict, quiz_menu: dict, quiz):
+    topic_menu = format_topic_menu()
+    quiz_menu_text = format_quiz_menu(quiz_data, quiz_menu)
+    circuit_texts = {key: format_circuit_text(key, circuits_data) for key in circuits_data}
+
+    replies = {
+        "topic_menu": {"type": "chat", "text": topic_menu},
+        "quiz_menu": {"type": "chat", "text": quiz_menu_text},
+    }
+    for key in ("series", "parallel"):
+        text = circuit_texts.get(key, "❌ Circuit topic not found.")
+        replies[f"circuit:{key}"] = {"type": "chat", "text": text + FORMULA_PROMPT}
+    for category, cat in quiz.categories.items():
+        replies[f"quiz_start:{category}"] = {"type": "chat", "text": cat.texts[0]}
+
+    return SimpleNamespace(
+        topic_menu=topic_menu,
+        quiz_menu=quiz_menu_text,
+        circuit_texts=circuit_texts,
+        normalized_topics={normalize_text(v): v for v in TOPIC_MENU.values()},
+        replies={name: CachedReply(payload) for name, payload in replies.items()},
+    )
 
-        if ans in NO_WORDS:
-            clear_formula_state()
-            return jsonify({"type": "chat", "text": "Alright. You may type /topic or /quiz to learn more."})
+# Every formatter used by build_content is defined by now.
+_startup_marks.append(("app setup", time.perf_counter()))
+content_store.load_initial()
+_startup_marks.append(("content", time.perf_counter()))
+
+# ------------------- Chat handlers -------------------
+# Each handler takes a ChatContext and returns a reply dict, a CachedReply, or
+# None to let the router try the next rule.
+
+def _reply_clear(ctx):
+    clear_state(ctx.state)
+    return {"type": "chat", "text": "🧹 Cleared state."}
+
+def _reply_topic_menu(ctx):
+    ctx.state.set(AWAITING_TOPIC_PICK)
+    return ctx.content.catalog.replies["topic_menu"]
+
+def _reply_quiz_menu(ctx):
+    c = ctx.content
+    if c.quiz_error and not c.quiz_data:
+        return {"type": "chat", "text": f"Quiz error: {c.quiz_error}"}
+    if not c.quiz_data:
+        return {"type": "chat", "text": "No quiz categories found."}
+    ctx.state.set(AWAITING_QUIZ_PICK)
+    return c.catalog.replies["quiz_menu"]
+
+def _reply_quiz_pick(ctx):
+    quiz_data, quiz_menu = ctx.content.quiz_data, ctx.content.quiz_menu
+    msg_clean = ctx.msg_clean
+    ctx.state.set(AWAITING_QUIZ_PICK, False)
+    category = quiz_menu.get(msg_clean) if isinstance(quiz_menu, dict) else None
+
+    if not category:
+        keys = sorted(list(quiz_data.keys()))
+        idx = int(msg_clean) - 1
+        category = keys[idx] if 0 <= idx < len(keys) else None
 
-        return jsonify({"type": "chat", "text": "Please reply with yes or no.\n\n📘 Would you like to learn more? (yes / no)"})
+    if not category or category not in quiz_data:
+        return {"type": "chat", "text": "❌ Invalid selection. Type /quiz to see the menu again."}
 
+    cat = ctx.content.quiz.get(category)
+    if cat is None:
+        clear_state(ctx.state)
+        return {"type": "chat", "text": f"No questions found in category: {category}."}
 
-    # topic selection mode  ✅ (THIS MUST BE OUTSIDE formula yes/no)
-    if session.get("awaiting_topic_pick"):
-        if msg_clean.isdigit():
-            topic_phrase = TOPIC_MENU.get(msg_clean)
-            if not topic_phrase:
-                return jsonify({"type": "chat", "text": "❌ Invalid selection. Type /topic to see the menu again."})
+    if not QUIZ_SHUFFLE:
+        start_quiz_state(ctx.state, category, 0)
+        return ctx.content.catalog.replies[f"quiz_start:{category}"]
+    seed = random.getrandbits(30)
+    start_quiz_state(ctx.state, category, 0, seed)
+    return {"type": "chat", "text": cat.question_text(1, question_index(len(cat), 0, seed))}
 
-            session["awaiting_topic_pick"] = False
-            reply, _tag = _match_intent(topic_phrase)
-            return jsonify({"type": "chat", "text": reply + COMMAND_FOOTER})
+def _reply_quiz_answer(ctx):
+    return grade_quiz_answer(ctx.state, ctx.msg)
 
-        normalized_menu = {normalize_text(v): v for v in TOPIC_MENU.values()}
-        if msg_clean in normalized_menu:
-            session["awaiting_topic_pick"] = False
-            reply, _tag = _match_intent(normalized_menu[msg_clean])
-            return jsonify({"type": "chat", "text": reply + COMMAND_FOOTER})
+def _reply_explain(ctx):
+    explain_topic = parse_explain_command(ctx.msg_clean)
+    if explain_topic:
+        return {"type": "explain", "topic": explain_topic}
+    return None
 
-        return jsonify({"type": "chat", "text": "❌ Please reply with a topic number or name.\nType /topic to see the menu again."})
+def _reply_slide_set(name: str):
+    def handler(ctx):
+        ctx.state.set(AWAITING_TOPIC_PICK, False)
+        return slide_set_reply(name, bundle=bool(ctx.payload.get("bundle")))
+    return handler
+
+def _reply_circuit(key: str):
+    def handler(ctx):
+        set_formula_state(ctx.state, key)
+        return ctx.content.catalog.replies[f"circuit:{key}"]
+    return handler
+
+def _reply_formula_choice(ctx):
+    ans = ctx.msg_clean
+    circuits_data = ctx.content.circuits_data
+
+    if ans in YES_WORDS:
+        key = ctx.state.last_formula_key
+        clear_formula_state(ctx.state)
+
+        imgs = []
+        if key and key in circuits_data:
+            imgs = circuits_data[key].get("formula_images", []) or []
+
+        if imgs:
+            return {"type": "chat", "text": "Here are the formulas:", "images": imgs}
+
+        return {"type": "chat", "text": "Sorry, currently no formula available."}
+
+    if ans in NO_WORDS:
+        clear_formula_state(ctx.state)
+        return {"type": "chat", "text": "Alright. You may type /topic or /quiz to learn more."}
+
+    return {"type": "chat", "text": "Please reply with yes or no.\n\n📘 Would you like to learn more? (yes / no)"}
+
+def _reply_topic_pick(ctx):
+    msg_clean = ctx.msg_clean
+    normalized_topics = ctx.content.catalog.normalized_topics
+    if msg_clean.isdigit():
+        topic_phrase = TOPIC_MENU.get(msg_clean)
+        if not topic_phrase:
+            return {"type": "chat", "text": "❌ Invalid selection. Type /topic to see the menu again."}
+
+        ctx.state.set(AWAITING_TOPIC_PICK, False)
+        reply, _tag = _match_intent(topic_phrase)
+        return {"type": "chat", "text": reply + COMMAND_FOOTER}
+
+    if msg_clean in normalized_topics:
+        ctx.state.set(AWAITING_TOPIC_PICK, False)
+        reply, _tag = _match_intent(normalized_topics[msg_clean])
+        return {"type": "chat", "text": reply + COMMAND_FOOTER}
+
+    return {"type": "chat", "text": "❌ Please reply with a topic number or name.\nType /topic to see the menu again."}
+
+def _reply_intent(ctx):
+    reply, tag = _match_intent(ctx.msg)
+    if tag == "noanswer":
+        found = _slide_search_reply(ctx.msg)
+        if found is not None:
+            return found
+    return {"type": "chat", "text": reply}
+
+# ------------------- Chat routing table -------------------
+# New commands and topics are added here, not as more branches in chat().
+# Topic keywords match with spaces ignored ("logicgates"); prefixes match the
+# start of the normalized message. Earlier topics win.
+TOPIC_ROUTES = [
+    {"name": "logic_gates", "keywords": ["logic gate", "logic gates"], "prefixes": ["logic gate"],
+     "handler": _reply_slide_set("logic_gates")},
+    {"name": "analog", "keywords": ["analog electronics", "analogue electronics"], "prefixes": ["analog"],
+     "handler": _reply_slide_set("analog")},
+    # series/parallel (works anytime, even after /topic)
+    {"name": "series", "keywords": ["series", "series circuit"], "prefixes": ["series"],
+     "handler": _reply_circuit("series")},
+    {"name": "parallel", "keywords": ["parallel", "parallel circuit"], "prefixes": ["parallel"],
+     "handler": _reply_circuit("parallel")},
+]
+
+chat_router = ChatRouter()
+chat_router.command("/clear", "clear", _reply_clear)
+chat_router.command("/topic", "topic_menu", _reply_topic_menu)
+chat_router.command("/quiz", "quiz_menu", _reply_quiz_menu)
+chat_router.state("quiz_pick", lambda ctx: ctx.state.has(AWAITING_QUIZ_PICK) and ctx.msg_clean.isdigit(), _reply_quiz_pick)
+chat_router.state("quiz_answer", lambda ctx: ctx.state.has(QUIZ_ACTIVE) and is_quiz_answer(ctx.msg), _reply_quiz_answer)
+chat_router.first_word("explain", "explain", _reply_explain)
+for route in TOPIC_ROUTES:
+    chat_router.topic(route["name"], route["handler"], route["keywords"], route["prefixes"])
+chat_router.state("formula_choice", lambda ctx: ctx.state.has(AWAITING_FORMULA_CHOICE), _reply_formula_choice, after_topics=True)
+# topic selection mode ✅ (must stay after formula yes/no)
+chat_router.state("topic_pick", lambda ctx: ctx.state.has(AWAITING_TOPIC_PICK), _reply_topic_pick, after_topics=True)
+chat_router.set_fallback("intent", _reply_intent)
 
+# ------------------- Chat API -------------------
+def _reply_response(reply):
+    if isinstance(reply, CachedReply):
+        return app.response_class(reply.body, mimetype="application/json")
+    return jsonify(reply)
 
-    # normal intents ✅ final fallback
-    reply, _tag = _match_intent(msg)
-    return jsonify({"type": "chat", "text": reply})
+@app.route("/chat", methods=["POST"])
+def chat():
+    payload = request.get_json(silent=True) or {}
+    msg = (payload.get("message", "") or "")
+    state = state_store.load(session)
+    ctx = ChatContext(msg, normalize_text(msg), payload, content(), state)
+
+    branch, reply = chat_router.dispatch(ctx)
+    _branch(branch)
+    state_store.save(session, state)
+    if payload.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+        return _stream_reply(reply)
+    return _reply_response(reply)
+
+# ------------------- Streaming chat (Server-Sent Events) -------------------
+# POST /chat with {"stream": true} or "Accept: text/event-stream" answers with
+#   event: reply   the reply without its image lists (+ "image_count")
+#   event: image   {"index", "url", "thumb", "srcset"} once that slide is rendered
+#   event: done
+# Slides are rendered into slide_cache in parallel and each is sent once it is
+# ready, so the text shows at once and the image chat.js loads first (the
+# thumbnail, or the image itself) comes from a warm cache. The render is
+# worked out from that exact URL; format=auto is negotiated from this
+# request's Accept, which chat.js sends with image/webp when it can show WebP.
+#
+# Waiting for renders holds a gthread request thread, so at most
+# STREAM_RENDER_WAITERS streams per worker do it at once, each also taking one
+# of the render pool's RENDER_WAITERS slots; the rest send their image events
+# straight away and the browser's own requests render the slides
+# (with the render pool's 503 backpressure) as before.
+IMAGE_LIST_KEYS = ("images", "thumbs", "srcsets")
+STREAM_RENDER_WAITERS = threading.BoundedSemaphore(max(1, int(os.environ.get("STREAM_RENDER_WAITERS", 1))))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+def _slide_job(url: str):
+    # (cache key, render fn, args) for a /pdf/... image URL, or None. Mirrors
+    # what pdf_page_png / pdf_bundle would render for that URL.
+    parts = urlsplit(url)
+    m = re.fullmatch(r"/pdf/([^/]+)/(?:page/(\d+)\.png|bundle)", parts.path)
+    if not m:
+        return None
+    pdf_path = os.path.join(PDF_DIR, os.path.basename(m.group(1)))
+    if not os.path.isfile(pdf_path):
+        return None
+    query = MultiDict(parse_qsl(parts.query))
+    if m.group(2):
+        fmt, res, _vary = _image_params(args=query)
+        if fmt is None:
+            return None
+        page = int(m.group(2))
+        return slide_key(pdf_path, page, res, fmt), render_page_timed, (pdf_path, page, res, fmt)
+    pages = parse_page_list(query.get("pages", ""))
+    fmt, res, _vary = _image_params(default_res=f"w{BUNDLE_TILE_WIDTH}", args=query)
+    if not pages or fmt is None:
+        return None
+    if not isinstance(res, str):
+        res = clamp_resolution(width=BUNDLE_TILE_WIDTH)
+    columns = min(max(query.get("cols", BUNDLE_COLUMNS, type=int), 1), BUNDLE_MAX_COLUMNS)
+    args = (pdf_path, pages, columns, res, fmt)
+    return bundle_key(*args), render_bundle_timed, args
+
+def _warm_slide(job) -> bool:
+    key, render_fn, args = job
+    if slide_cache.contains(key):
+        return True
+    try:
+        data, _stages = render_pool.run(render_fn, *args)
+    except (RenderBusy, RenderTimeout):
+        return False  # the browser's own request will retry the render
+    if data is None:
+        return False
+    slide_cache.put(key, data)
+    return True
+
+def _stream_reply(reply):
+    if isinstance(reply, CachedReply):
+        reply = reply.payload
+    head = {k: v for k, v in reply.items() if k not in IMAGE_LIST_KEYS}
+    images = reply.get("images") or []
+    if isinstance(images, str):
+        images = [images]
+    head["image_count"] = len(images)
+    thumbs = reply.get("thumbs") or [None] * len(images)
+    srcsets = reply.get("srcsets") or [None] * len(images)
+
+    items = []
+    for i, url in enumerate(images):
+        item = {"index": i, "url": url, "thumb": thumbs[i], "srcset": srcsets[i]}
+        items.append((item, _slide_job(thumbs[i] or url)))
+
+    def generate():
+        yield _sse("reply", head)
+        pending = [job for _item, job in items if job is not None and not slide_cache.contains(job[0])]
+        if not pending or not STREAM_RENDER_WAITERS.acquire(blocking=False):
+            pending = []
+        elif not render_pool.try_wait():
+            STREAM_RENDER_WAITERS.release()
+            pending = []
+        if not pending:
+            for item, _job in items:
+                yield _sse("image", item)
+            yield _sse("done", {})
+            return
+        # renders run in parallel; images are still sent in slide order
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(render_pool.workers, len(pending)))) as pool:
+                futures = [pool.submit(_warm_slide, job) if job in pending else None for _item, job in items]
+                for (item, _job), fut in zip(items, futures):
+                    if fut is not None:
+                        fut.result()
+                    yield _sse("image", item)
+        finally:
+            render_pool.end_wait()
+            STREAM_RENDER_WAITERS.release()
+        yield _sse("done", {})
+
+    resp = app.response_class(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    return resp
+
+# ------------------- Batch chat -------------------
+CHAT_BATCH_MAX = int(os.environ.get("CHAT_BATCH_MAX", 100))
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    # {"messages": ["/quiz", "1", "2", ...]} -> {"replies": [...]} in order.
+    # Items may also be objects like {"message": "logic gates", "bundle": true}.
+    # All messages share one state load/save and one content snapshot.
+    payload = request.get_json(silent=True) or {}
+    messages = payload.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "Expected a non-empty 'messages' list."}), 400
+    if len(messages) > CHAT_BATCH_MAX:
+        return jsonify({"error": f"At most {CHAT_BATCH_MAX} messages per batch."}), 400
+
+    state = state_store.load(session)
+    c = content()
+    replies = []
+    for item in messages:
+        item_payload = item if isinstance(item, dict) else {"message": item, "bundle": payload.get("bundle")}
+        msg = (item_payload.get("message", "") or "")
+        if not isinstance(msg, str):
+            msg = str(msg)
+        ctx = ChatContext(msg, normalize_text(msg), item_payload, c, state)
+        _name, reply = chat_router.dispatch(ctx)
+        replies.append(reply.payload if isinstance(reply, CachedReply) else reply)
+
+    _branch("batch")
+    state_store.save(session, state)
+    return jsonify({"replies": replies})
 
 # ------------------- APIs -------------------
 def _to_float(x):
@@ -526,6 +1215,169 @@ def api_ohm():
     Rcalc = V / I
     return jsonify({"result": f"Using R = V ÷ I\nR = {V} ÷ {I} = {Rcalc:.4g} Ω"})
 
+# ------------------- Bulk Ohm's law (CSV / NDJSON) -------------------
+# POST /api/ohm/bulk with a text/csv body (header V,I,R and optional id) or an
+# application/x-ndjson body ({"V": .., "I": .., "R": .., "id": ..} per line).
+# Rows are read from the request stream and solved OHM_BULK_CHUNK at a time
+# with NumPy, and each result row is streamed back as soon as its chunk is
+# done, so memory stays flat however large the upload is. Values go through
+# _to_float, like /api/ohm. Output is in the input's format unless
+# ?format=csv|ndjson is given; "error" is one of OHM_ERRORS or empty.
+OHM_BULK_CHUNK = int(os.environ.get("OHM_BULK_CHUNK", 1000))
+OHM_ERRORS = {
+    "bad_row": "Row could not be parsed.",
+    "need_two_values": "Please enter any TWO values (V, I, R) to calculate the third.",
+    "too_many_values": "Please provide ONLY two values.",
+    "zero_resistance": "R cannot be 0 for I = V/R.",
+    "zero_current": "I cannot be 0 for R = V/I.",
+    "not_finite": "Result is not a finite number.",
+}
+NDJSON_MIMETYPES = {"application/x-ndjson", "application/jsonl"}
+
+OHM_BULK_MAX_LINE = 64 * 1024
+
+def _body_lines(stream, max_len: int = OHM_BULK_MAX_LINE):
+    # Yields decoded lines of the request body, or None for a line longer than
+    # max_len (whose remainder is skipped), without ever holding more than one.
+    while True:
+        line = stream.readline(max_len + 1)
+        if not line:
+            return
+        if len(line) > max_len and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_len + 1)
+            yield None
+            continue
+        yield line.decode("utf-8", errors="replace")
+
+def _ohm_rows_csv(lines):
+    # Yields (id, V, I, R raw values), or None for rows that can't be read.
+    columns = None
+    for line in lines:
+        if line is None:
+            yield None
+            continue
+        cells = next(csv.reader([line]), [])
+        if not any(c.strip() for c in cells):
+            continue
+        if columns is None:
+            names = [c.strip().lower() for c in cells]
+            if {"v", "i", "r"} & set(names) and set(names) <= {"v", "i", "r", "id"}:
+                columns = {n: names.index(n) for n in names}
+                continue
+            columns = {"v": 0, "i": 1, "r": 2}  # no header: V,I,R by position
+        get = lambda name: cells[columns[name]] if name in columns and columns[name] < len(cells) else None  # noqa: E731
+        yield get("id"), get("v"), get("i"), get("r")
+
+def _ohm_rows_ndjson(lines):
+    for line in lines:
+        if line is not None and not line.strip():
+            continue
+        try:
+            obj = json.loads(line) if line is not None else None
+        except ValueError:
+            obj = None
+        if not isinstance(obj, dict):
+            yield None
+            continue
+        yield obj.get("id"), obj.get("V", obj.get("v")), obj.get("I", obj.get("i")), obj.get("R", obj.get("r"))
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def solve_ohm_chunk(chunk):
+    # chunk: [(id, V, I, R) or None]. Returns [(id, V, I, R, solved, error code)].
+    n = len(chunk)
+    vals = np.zeros((3, n))
+    given = np.zeros((3, n), dtype=bool)
+    bad = np.zeros(n, dtype=bool)
+    for j, row in enumerate(chunk):
+        if row is None:
+            bad[j] = True
+            continue
+        for k in range(3):
+            x = _to_float(row[k + 1])
+            if x is not None:
+                vals[k, j] = x
+                given[k, j] = True
+
+    V, I, R = vals
+    count = given.sum(axis=0)
+    solve_v = (count == 2) & ~given[0]
+    solve_i = (count == 2) & ~given[1]
+    solve_r = (count == 2) & ~given[2]
+    zero_r = solve_i & (R == 0)
+    zero_i = solve_r & (I == 0)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        V = np.where(solve_v, I * R, V)
+        I = np.where(solve_i & ~zero_r, V / np.where(R == 0, 1, R), I)
+        R = np.where(solve_r & ~zero_i, V / np.where(I == 0, 1, I), R)
+    finite = np.isfinite(V) & np.isfinite(I) & np.isfinite(R)
+
+    errors = np.full(n, "", dtype=object)
+    errors[~finite] = "not_finite"
+    errors[zero_i] = "zero_current"
+    errors[zero_r] = "zero_resistance"
+    errors[count > 2] = "too_many_values"
+    errors[count < 2] = "need_two_values"
+    errors[bad] = "bad_row"
+    solved = np.where(solve_v, "V", np.where(solve_i, "I", np.where(solve_r, "R", "")))
+
+    out = []
+    for j, (v, i, r, s, e) in enumerate(zip(V.tolist(), I.tolist(), R.tolist(), solved.tolist(), errors.tolist())):
+        row_id = chunk[j][0] if chunk[j] is not None else None
+        if e:
+            # echo back what was given; nothing is solved
+            v, i, r = (vals[k, j].item() if given[k, j] and np.isfinite(vals[k, j]) else None for k in range(3))
+            s = ""
+        out.append((row_id, v, i, r, s, e))
+    return out
+
+@app.route("/api/ohm/bulk", methods=["POST"])
+def api_ohm_bulk():
+    in_fmt = "csv" if request.mimetype == "text/csv" else (
+        "ndjson" if request.mimetype in NDJSON_MIMETYPES else None)
+    if in_fmt is None:
+        return jsonify({"error": "Send a text/csv or application/x-ndjson body."}), 415
+    out_fmt = (request.args.get("format") or in_fmt).lower()
+    if out_fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    lines = _body_lines(request.stream)
+    rows = _ohm_rows_csv(lines) if in_fmt == "csv" else _ohm_rows_ndjson(lines)
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if out_fmt == "csv":
+            writer.writerow(("row", "id", "V", "I", "R", "solved", "error"))
+        row_num = 0
+        for chunk in _chunks(rows, max(1, OHM_BULK_CHUNK)):
+            for row_id, v, i, r, solved, error in solve_ohm_chunk(chunk):
+                row_num += 1
+                if out_fmt == "csv":
+                    writer.writerow((row_num, "" if row_id is None else row_id,
+                                     *("" if x is None else f"{x:.6g}" for x in (v, i, r)), solved, error))
+                else:
+                    buf.write(json.dumps({
+                        "row": row_num, "id": row_id, "V": v, "I": i, "R": r,
+                        "solved": solved or None, "error": error or None,
+                        "message": OHM_ERRORS.get(error),
+                    }, separators=(",", ":")) + "\n")
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    mimetype = "text/csv" if out_fmt == "csv" else "application/x-ndjson"
+    return app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
 def parse_resistor_values(values: str):
     if not values:
         return []
@@ -555,6 +1407,9 @@ def parallel_resistance(rs):
 def api_resistors():
     payload = request.get_json(silent=True) or {}
     values = payload.get("values", "")
+    expression = payload.get("expression") or (values if looks_like_network(str(values)) else None)
+    if expression:
+        return jsonify({"result": format_network_result(str(expression))})
     rs = parse_resistor_values(values)
 
     if rs is None:
@@ -578,6 +1433,98 @@ def api_resistors():
 
     return jsonify({"result": "\n".join(out)})
 
+# ------------------- Resistor networks -------------------
+# "(10+20)||(30||60)+5": "+" is series, "||" (or "//") parallel; see resistor_net.py.
+RESISTOR_BATCH_MAX = int(os.environ.get("RESISTOR_BATCH_MAX", 10000))
+
+def format_network_result(expression: str) -> str:
+    try:
+        total = evaluate_network(expression)
+    except NetworkError as e:
+        return f"{e}\nExample network: (10+20)||(30||60)+5  (+ = series, || = parallel)"
+    return f"Network: {expression.strip()}\nTotal resistance: {total:.4g} Ω"
+
+def _read_network_rows():
+    # Returns ([(id or None, network), ...], None) or (None, error message).
+    # JSON: {"networks": ["10+20", {"id": "q1", "network": "10||10"}, ...]}
+    # CSV (Content-Type: text/csv): a "network" column and optional "id"
+    # column, or no header and the network in the first column.
+    if request.mimetype == "text/csv":
+        lines = request.get_data(as_text=True).splitlines()
+        rows = [r for r in csv.reader(lines) if r and any(cell.strip() for cell in r)]
+        header = [h.strip().lower() for h in rows[0]] if rows else []
+        if "network" in header:
+            col, id_col = header.index("network"), (header.index("id") if "id" in header else None)
+            rows = rows[1:]
+        else:
+            col, id_col = 0, None
+        return [(r[id_col] if id_col is not None and id_col < len(r) else None,
+                 r[col] if col < len(r) else "") for r in rows], None
+
+    payload = request.get_json(silent=True) or {}
+    networks = payload.get("networks")
+    if not isinstance(networks, list):
+        return None, "Expected a 'networks' list, or a text/csv body with a 'network' column."
+    out = []
+    for item in networks:
+        if isinstance(item, dict):
+            out.append((item.get("id"), str(item.get("network") or "")))
+        else:
+            out.append((None, "" if item is None else str(item)))
+    return out, None
+
+@app.route("/api/resistors/batch", methods=["POST"])
+def api_resistors_batch():
+    # -> {"results": [{"index", "id", "network", "ohms", "error"}, ...], "count", "errors"}
+    rows, error = _read_network_rows()
+    if error:
+        return jsonify({"error": error}), 400
+    if not rows:
+        return jsonify({"error": "No networks given."}), 400
+    if len(rows) > RESISTOR_BATCH_MAX:
+        return jsonify({"error": f"At most {RESISTOR_BATCH_MAX} networks per batch."}), 400
+
+    results = []
+    for i, ((row_id, network), (ohms, err)) in enumerate(zip(rows, evaluate_networks([n for _id, n in rows]))):
+        item = {"index": i, "network": network, "ohms": ohms, "error": err}
+        if row_id is not None:
+            item["id"] = row_id
+        results.append(item)
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+    })
+
+# ------------------- Startup report -------------------
+# Everything above runs once per process, or once in total under
+# `gunicorn --preload`, where forked workers share the parsed content and
+# indexes copy-on-write. PyMuPDF is not imported here; the first slide render
+# loads it (slides.load_fitz).
+def startup_report() -> str:
+    parts = []
+    for (_prev, t_prev), (name, t) in zip(_startup_marks, _startup_marks[1:]):
+        parts.append(f"{name} {(t - t_prev) * 1000:.0f} ms")
+    total = (_startup_marks[-1][1] - _startup_marks[0][1]) * 1000
+    pymupdf = "loaded" if fitz_loaded() else "not loaded"
+    return f"startup (pid {os.getpid()}): {', '.join(parts)}, total {total:.0f} ms; PyMuPDF {pymupdf}"
+
+@app.cli.command("startup-report")
+def startup_report_command():
+    """Print how long importing the app took, by phase."""
+    click.echo(startup_report())
+
+_startup_marks.append(("routes", time.perf_counter()))
+
+# Objects created so far live for the whole process; moving them out of the
+# collector's generations stops gc passes in forked workers from writing to
+# (and so copying) the shared pages.
+gc.freeze()
+
+# Logged at INFO like the rest of the app; `flask startup-report` prints it on demand.
+if os.environ.get("STARTUP_REPORT", "1") == "1":
+    app.logger.info(startup_report())
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,102 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+try:
+    import brotli  # optional: without it only .gz variants are built
+except ImportError:
+    brotli = None
+
+# ------------------- Static asset pipeline -------------------
+# `flask build-assets` copies every file in static/ to static/dist/ under a
+# content-hashed name (chat.js -> chat.1a2b3c4d5e.js), writes .gz and .br
+# variants of text assets next to it, and records the mapping in
+# static/dist/manifest.json. Hashed files never change, so they are served
+# with a one-year immutable Cache-Control; a new build gives new URLs.
+# Without a manifest (dev checkout) URLs fall back to plain /static/.
+
+HASH_LENGTH = 10
+COMPRESSIBLE = {".js", ".css", ".svg", ".json", ".html", ".txt", ".map"}
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # preferred first
+MANIFEST_NAME = "manifest.json"
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _write(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(src_dir: str, out_dir: str, log=None) -> dict:
+    # Returns the manifest {source name: hashed name}. Outputs that already
+    # exist are kept (same name = same content); stale ones are removed.
+    os.makedirs(out_dir, exist_ok=True)
+    manifest, keep = {}, {MANIFEST_NAME}
+    for name in sorted(os.listdir(src_dir)):
+        path = os.path.join(src_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        out_name = hashed_name(name, data)
+        manifest[name] = out_name
+        keep.add(out_name)
+
+        out_path = os.path.join(out_dir, out_name)
+        if not os.path.exists(out_path):
+            _write(out_path, data)
+        sizes = [f"{len(data)} B"]
+        if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+            variants = [("gzip", ".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+            for label, suffix, compress in variants:
+                keep.add(out_name + suffix)
+                if not os.path.exists(out_path + suffix):
+                    _write(out_path + suffix, compress(data))
+                sizes.append(f"{label} {os.path.getsize(out_path + suffix)} B")
+        if log:
+            log(f"  {name} -> {out_name} ({', '.join(sizes)})")
+
+    for name in os.listdir(out_dir):
+        if name not in keep:
+            os.remove(os.path.join(out_dir, name))
+    _write(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def list_outputs(out_dir: str) -> set:
+    try:
+        return set(os.listdir(out_dir)) - {MANIFEST_NAME}
+    except OSError:
+        return set()
+
+
+def pick_encoding(name: str, available: set, accept_encodings):
+    # Returns (file name to send, Content-Encoding or None). accept_encodings
+    # is werkzeug's request.accept_encodings.
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and name + suffix in available:
+            return name + suffix, encoding
+    return name, None
+
+
+def guess_mimetype(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+# ------------------- Benchmark / load test -------------------
+# Replays scripted conversations against the app and reports throughput and
+# p50/p95/p99 latency per route.
+#
+#   python bench.py                                  # in-process (Flask test client)
+#   python bench.py --http --spawn                   # real HTTP against a local gunicorn
+#   python bench.py --http --url http://host:port    # real HTTP against a running server
+#   python bench.py --save-baseline bench_baseline.json
+#   python bench.py --compare bench_baseline.json    # exit 1 on p95 regressions
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Each conversation runs in a fresh session. Steps are ("chat", label, message)
+# or ("post", label, path, json) - chat replies with images also fetch them.
+CONVERSATIONS = {
+    "topic": [
+        ("chat", "topic", "/topic"),
+        ("chat", "topic", "6"),
+        ("chat", "topic", "/topic"),
+        ("chat", "topic", "binary number system"),
+    ],
+    "quiz": [
+        ("chat", "quiz", "/quiz"),
+        ("chat", "quiz", "6"),
+        ("chat", "quiz", "2"),
+        ("chat", "quiz", "4"),
+        ("chat", "quiz", "2"),
+        ("chat", "quiz", "2"),
+    ],
+    "explain": [
+        ("chat", "explain", "explain ohm"),
+        ("chat", "explain", "explain xor"),
+    ],
+    "formula": [
+        ("chat", "formula", "series"),
+        ("chat", "formula", "yes"),
+        ("chat", "formula", "parallel"),
+        ("chat", "formula", "no"),
+    ],
+    "intents": [
+        ("chat", "intent", "hello"),
+        ("chat", "intent", "what is a half adder"),
+        ("chat", "intent", "binry number sytem"),
+        ("chat", "intent", "something completely unrelated"),
+    ],
+    "slides": [
+        ("chat", "slides", "logic gates"),
+    ],
+    "api": [
+        ("post", "api", "/api/ohm", {"V": "12", "I": "", "R": "4"}),
+        ("post", "api", "/api/ohm", {"V": "", "I": "2", "R": "5"}),
+        ("post", "api", "/api/resistors", {"values": "10,20,30"}),
+        ("post", "api", "/api/resistors", {"values": "100,220,470,1000"}),
+    ],
+}
+
+
+# ------------------- Clients -------------------
+class InProcessClient:
+    def __init__(self):
+        sys.path.insert(0, BASE_DIR)
+        from app import app
+        self.client = app.test_client()
+
+    def post(self, path, payload):
+        r = self.client.post(path, json=payload)
+        return r.status_code, r.get_json(silent=True)
+
+    def get(self, path):
+        r = self.client.get(path)
+        r.get_data()
+        return r.status_code
+
+
+class HttpClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def _open(self, req):
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def post(self, path, payload):
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        status, body = self._open(req)
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+    def get(self, path):
+        status, _body = self._open(urllib.request.Request(self.base_url + path))
+        return status
+
+
+# ------------------- Runner -------------------
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, seconds: float, ok: bool):
+        with self._lock:
+            self.samples.setdefault(key, []).append(seconds)
+            if not ok:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def _timed(rec: Recorder, key: str, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    status = result[0] if isinstance(result, tuple) else result
+    rec.add(key, elapsed, 200 <= status < 400)
+    return result
+
+
+def run_conversation(make_client, name: str, rec: Recorder, fetch_images: bool):
+    client = make_client()
+    for step in CONVERSATIONS[name]:
+        if step[0] == "chat":
+            _kind, label, message = step
+            _status, data = _timed(rec, f"POST /chat [{label}]", client.post, "/chat", {"message": message})
+            if fetch_images and data and data.get("images"):
+                for url in data["images"]:
+                    route = "GET /pdf/*/bundle" if "/bundle" in url else (
+                        "GET /pdf/*/page" if url.startswith("/pdf/") else "GET /static")
+                    _timed(rec, route, client.get, url)
+        else:
+            _kind, label, path, payload = step
+            _timed(rec, f"POST {path}", client.post, path, payload)
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[i]
+
+
+def summarize(rec: Recorder, wall_seconds: float) -> dict:
+    report = {}
+    for key, values in sorted(rec.samples.items()):
+        v = sorted(values)
+        report[key] = {
+            "count": len(v),
+            "errors": rec.errors.get(key, 0),
+            "rps": len(v) / wall_seconds if wall_seconds else 0.0,
+            "p50_ms": percentile(v, 50) * 1000,
+            "p95_ms": percentile(v, 95) * 1000,
+            "p99_ms": percentile(v, 99) * 1000,
+        }
+    return report
+
+
+def print_report(report: dict, baseline: dict = None):
+    header = f"{'route':34} {'count':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f" {'p95 vs base':>12}"
+    print(header)
+    for key, r in report.items():
+        line = (f"{key:34} {r['count']:6d} {r['errors']:4d} {r['rps']:8.1f} "
+                f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f}")
+        if baseline and key in baseline and baseline[key]["p95_ms"] > 0:
+            change = r["p95_ms"] / baseline[key]["p95_ms"] - 1
+            line += f" {change:+11.0%}"
+        print(line)
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float, floor_ms: float):
+    # A route regresses when its p95 grows by more than tolerance and by more
+    # than floor_ms (so sub-millisecond noise doesn't fail the run).
+    out = []
+    for key, r in report.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance) and r["p95_ms"] - base["p95_ms"] > floor_ms:
+            out.append((key, base["p95_ms"], r["p95_ms"]))
+    return out
+
+
+# ------------------- Local gunicorn -------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_gunicorn(workers: int, threads: int):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--worker-class", "gthread", "--threads", str(threads)],
+        cwd=BASE_DIR,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit("gunicorn exited during startup")
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not start within 30s")
+
+
+# ------------------- CLI -------------------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark /chat, /pdf and /api routes.")
+    ap.add_argument("--http", action="store_true", help="use real HTTP instead of the in-process test client")
+    ap.add_argument("--url", default=None, help="base URL of a running server (with --http)")
+    ap.add_argument("--spawn", action="store_true", help="start a local gunicorn (with --http)")
+    ap.add_argument("--workers", type=int, default=2, help="gunicorn workers for --spawn")
+    ap.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker for --spawn")
+    ap.add_argument("--rounds", type=int, default=20, help="times each conversation is replayed")
+    ap.add_argument("--concurrency", type=int, default=4, help="conversations run in parallel")
+    ap.add_argument("--only", action="append", choices=sorted(CONVERSATIONS), help="limit to these conversations")
+    ap.add_argument("--no-images", action="store_true", help="don't fetch slide/formula images")
+    ap.add_argument("--save-baseline", metavar="FILE", help="write this run's results as a baseline")
+    ap.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth vs baseline (0.25 = 25%%)")
+    ap.add_argument("--floor-ms", type=float, default=2.0, help="ignore p95 growth smaller than this")
+    args = ap.parse_args(argv)
+
+    proc = None
+    if args.http:
+        if args.spawn:
+            proc, url = spawn_gunicorn(args.workers, args.threads)
+        elif args.url:
+            url = args.url
+        else:
+            ap.error("--http needs --url or --spawn")
+        make_client = lambda: HttpClient(url)  # noqa: E731
+        mode = f"http {url}"
+    else:
+        InProcessClient()  # import the app once, outside the timings
+        make_client = InProcessClient
+        mode = "in-process"
+
+    names = args.only or list(CONVERSATIONS)
+    jobs = [name for _ in range(args.rounds) for name in names]
+    rec = Recorder()
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            for fut in [pool.submit(run_conversation, make_client, n, rec, not args.no_images) for n in jobs]:
+                fut.result()
+        wall = time.perf_counter() - started
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = summarize(rec, wall)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["routes"]
+
+    print(f"Mode: {mode}, {len(jobs)} conversations, concurrency {args.concurrency}, {wall:.2f}s wall")
+    print_report(report, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "created": time.time(), "routes": report}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if baseline:
+        regressions = find_regressions(report, baseline, args.tolerance, args.floor_ms)
+        for key, before, after in regressions:
+            print(f"REGRESSION {key}: p95 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
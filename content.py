@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# ------------------- Content store (intents / quiz / circuits) -------------------
+# The JSON files are parsed and every derived structure (intent index, menus,
+# ...) is built into one snapshot object by the app's build function. Reloads
+# build a complete new snapshot off the request path and swap it in with a
+# single assignment, so a request always sees one consistent version. A file
+# that fails to parse or build is rejected and the last good snapshot stays.
+
+logger = logging.getLogger(__name__)
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ContentStore:
+    def __init__(self, files: dict, build, poll_interval: float = 5.0):
+        # files: name -> path; build(parsed) -> snapshot, where parsed maps each
+        # name to its JSON (or, on the first load only, the exception raised).
+        self.files = files
+        self.build = build
+        self.poll_interval = poll_interval
+        self.current = None
+        self.version = 0
+        self.loaded_at = None
+        self.last_error = None
+        self._stamps = {}
+        self._next_poll = 0.0
+        self._reload_lock = threading.Lock()
+
+    def load_initial(self):
+        stamps = {name: _stamp(path) for name, path in self.files.items()}
+        parsed = {}
+        for name, path in self.files.items():
+            try:
+                parsed[name] = read_json(path)
+            except Exception as e:
+                parsed[name] = e
+        self._swap(self.build(parsed), stamps)
+        return self.current
+
+    def reload(self):
+        # Returns (ok, error message). Blocking; use poll() from request hooks.
+        with self._reload_lock:
+            stamps = {name: _stamp(path) for name, path in self.files.items()}
+            try:
+                parsed = {name: read_json(path) for name, path in self.files.items()}
+                snapshot = self.build(parsed)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                # remember the stamps so a broken file isn't re-parsed every poll
+                self._stamps = stamps
+                logger.warning(f"Content reload rejected, keeping version {self.version}: {self.last_error}")
+                return False, self.last_error
+            self._swap(snapshot, stamps)
+            self.last_error = None
+            logger.info(f"Content reloaded (version {self.version})")
+            return True, None
+
+    def _swap(self, snapshot, stamps):
+        self.current = snapshot
+        self._stamps = stamps
+        self.version += 1
+        self.loaded_at = time.time()
+
+    def changed(self) -> bool:
+        return any(_stamp(path) != self._stamps.get(name) for name, path in self.files.items())
+
+    def poll(self):
+        # Cheap enough for a before_request hook: at most one stat() round per
+        # interval, and the rebuild itself runs in a background thread.
+        if self.poll_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        if self.changed() and not self._reload_lock.locked():
+            threading.Thread(target=self.reload, daemon=True).start()
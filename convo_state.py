@@ -0,0 +1,237 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------- Conversation state -------------------
+# All per-user chat state lives in one slotted record. It is stored as a short
+# list of small ints - [flags, quiz category (its position in the app's quiz
+# menu), quiz index, correct, answered, formula key, quiz order seed] with
+# trailing defaults dropped - either inside the signed cookie
+# or in a server-side store with only an opaque id in the cookie. State is
+# only written back when it actually changed.
+
+QUIZ_ACTIVE = 1
+AWAITING_QUIZ_PICK = 2
+AWAITING_TOPIC_PICK = 4
+AWAITING_FORMULA_CHOICE = 8
+
+FORMULA_KEYS = ("series", "parallel")  # stored as 1, 2; anything else as a string
+
+# keys older cookies used; migrated on first load
+LEGACY_KEYS = (
+    "quiz_active", "quiz_category", "quiz_index", "quiz_correct", "quiz_answered",
+    "awaiting_quiz_pick", "awaiting_topic_pick", "awaiting_formula_choice", "last_formula_key",
+)
+
+
+class ConversationState:
+    __slots__ = ("flags", "quiz_category", "quiz_index", "quiz_correct", "quiz_answered",
+                 "last_formula_key", "quiz_seed", "_loaded")
+
+    def __init__(self):
+        self.flags = 0
+        self.quiz_category = None
+        self.quiz_index = None
+        self.quiz_correct = 0
+        self.quiz_answered = 0
+        self.last_formula_key = None
+        self.quiz_seed = None  # None: questions in file order
+        self._loaded = None
+
+    # ------------------- Flags -------------------
+    def has(self, flag: int) -> bool:
+        return bool(self.flags & flag)
+
+    def set(self, flag: int, on: bool = True):
+        if on:
+            self.flags |= flag
+        else:
+            self.flags &= ~flag
+
+    # ------------------- Encoding -------------------
+    def encode(self):
+        formula = self.last_formula_key
+        if formula in FORMULA_KEYS:
+            formula = FORMULA_KEYS.index(formula) + 1
+        data = [self.flags, self.quiz_category, self.quiz_index,
+                self.quiz_correct, self.quiz_answered, formula, self.quiz_seed]
+        defaults = [0, None, None, 0, 0, None, None]
+        while data and data[-1] == defaults[len(data) - 1]:
+            data.pop()
+        return data or None
+
+    @classmethod
+    def decode(cls, data):
+        state = cls()
+        if isinstance(data, list):
+            data = data + [None] * (7 - len(data))
+            flags, category, index, correct, answered, formula, seed = data[:7]
+            state.flags = int(flags or 0)
+            state.quiz_category = category
+            state.quiz_index = index
+            state.quiz_correct = int(correct or 0)
+            state.quiz_answered = int(answered or 0)
+            if isinstance(formula, int) and 1 <= formula <= len(FORMULA_KEYS):
+                formula = FORMULA_KEYS[formula - 1]
+            state.last_formula_key = formula
+            state.quiz_seed = seed if isinstance(seed, int) else None
+        state._loaded = state.encode()
+        return state
+
+    @classmethod
+    def from_legacy(cls, session):
+        state = cls()
+        state.set(QUIZ_ACTIVE, bool(session.get("quiz_active")))
+        state.set(AWAITING_QUIZ_PICK, bool(session.get("awaiting_quiz_pick")))
+        state.set(AWAITING_TOPIC_PICK, bool(session.get("awaiting_topic_pick")))
+        state.set(AWAITING_FORMULA_CHOICE, bool(session.get("awaiting_formula_choice")))
+        state.quiz_category = session.get("quiz_category")
+        state.quiz_index = session.get("quiz_index")
+        state.quiz_correct = int(session.get("quiz_correct", 0))
+        state.quiz_answered = int(session.get("quiz_answered", 0))
+        state.last_formula_key = session.get("last_formula_key")
+        return state
+
+    def changed(self) -> bool:
+        return self.encode() != self._loaded
+
+
+# ------------------- Stores -------------------
+class StateStore:
+    # Base: cookie storage. load()/save() take the Flask session.
+    COOKIE_KEY = "s"
+
+    def load(self, session) -> ConversationState:
+        if any(k in session for k in LEGACY_KEYS):
+            state = ConversationState.from_legacy(session)
+            for k in LEGACY_KEYS:
+                session.pop(k, None)
+            return state
+        return ConversationState.decode(self._get(session))
+
+    def save(self, session, state: ConversationState):
+        if not state.changed():
+            return
+        data = state.encode()
+        self._put(session, data)
+        state._loaded = data
+
+    def _get(self, session):
+        return session.get(self.COOKIE_KEY)
+
+    def _put(self, session, data):
+        if data is None:
+            session.pop(self.COOKIE_KEY, None)
+        else:
+            session[self.COOKIE_KEY] = data
+
+
+class CookieStateStore(StateStore):
+    pass
+
+
+class _ServerStateStore(StateStore):
+    # Only an opaque id goes in the cookie; it is set once and then the cookie
+    # no longer changes, so Flask stops re-signing and re-sending it.
+    COOKIE_KEY = "sid"
+
+    def _get(self, session):
+        sid = session.get(self.COOKIE_KEY)
+        return self.get(sid) if sid else None
+
+    def _put(self, session, data):
+        sid = session.get(self.COOKIE_KEY)
+        if data is None:
+            if sid:
+                self.delete(sid)
+            return
+        if not sid:
+            sid = secrets.token_urlsafe(12)
+            session[self.COOKIE_KEY] = sid
+        self.put(sid, data)
+
+
+class MemoryStateStore(_ServerStateStore):
+    # Per-process LRU: only correct with a single gunicorn worker (threads are fine).
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            data = self._items.get(sid)
+            if data is not None:
+                self._items.move_to_end(sid)
+            return data
+
+    def put(self, sid, data):
+        with self._lock:
+            self._items[sid] = data
+            self._items.move_to_end(sid)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+
+class SqliteStateStore(_ServerStateStore):
+    # Shared by every worker on the host. Rows unused for ttl seconds are
+    # pruned; reads count as use, refreshing the row's time at most once per ttl/2.
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS convo_state (sid TEXT PRIMARY KEY, data TEXT, updated REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid):
+        conn = self._conn()
+        row = conn.execute("SELECT data, updated FROM convo_state WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now - self.ttl / 2:
+            conn.execute("UPDATE convo_state SET updated = ? WHERE sid = ?", (now, sid))
+        return json.loads(row[0])
+
+    def put(self, sid, data):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO convo_state (sid, data, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+            (sid, json.dumps(data, separators=(",", ":")), now),
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            conn.execute("DELETE FROM convo_state WHERE updated < ?", (now - self.ttl,))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM convo_state WHERE sid = ?", (sid,))
+
+
+def make_state_store(kind: str, sqlite_path: str = None):
+    kind = (kind or "cookie").lower()
+    if kind == "memory":
+        return MemoryStateStore()
+    if kind == "sqlite":
+        return SqliteStateStore(sqlite_path or "convo_state.sqlite3")
+    return CookieStateStore()
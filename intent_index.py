@@ -0,0 +1,203 @@
+import numpy as np
+
+# ------------------- Intent index (built once per intents.json load) -------------------
+# Patterns are ranked the same way _match_intent always ranked them: longest
+# normalized pattern first, ties kept in intents.json order. Lower rank wins.
+
+
+class IntentIndex:
+    def __init__(self, intents, normalize, fuzzy_threshold: float = 0.5):
+        self.patterns = []   # rank -> (normalized pattern, intent)
+        self.exact = {}      # normalized pattern -> intent (best rank)
+        self.trie = {}       # token -> child node; "$" holds [(rank, lead, trail)]
+
+        pattern_list = []
+        for intent in intents:
+            for pattern in intent.get("patterns", []):
+                p = normalize(pattern)
+                if p:
+                    pattern_list.append((p, intent))
+        pattern_list.sort(key=lambda x: len(x[0]), reverse=True)
+        self.patterns = pattern_list
+
+        for rank, (p, intent) in enumerate(pattern_list):
+            self.exact.setdefault(p, intent)
+            self._insert(p, rank)
+
+        self.fuzzy = FuzzyMatcher([p for p, _intent in pattern_list])
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def _insert(self, pattern: str, rank: int):
+        tokens = pattern.split()
+        if not tokens:
+            return
+        node = self.trie
+        for tok in tokens:
+            node = node.setdefault(tok, {})
+        # A leading/trailing space in the normalized pattern (e.g. "/quiz" -> " quiz")
+        # means \b...\b only matches when another word sits on that side.
+        node.setdefault("$", []).append((rank, pattern[0] == " ", pattern[-1] == " "))
+
+    # ------------------- Lookups -------------------
+    def match_exact(self, text: str):
+        return self.exact.get(text)
+
+    def match_term(self, text: str):
+        tokens = text.split()
+        n = len(tokens)
+        best = None
+        for i in range(n):
+            node = self.trie
+            for j in range(i, n):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                for rank, lead, trail in node.get("$", ()):
+                    if best is not None and rank >= best:
+                        continue
+                    if lead and i == 0:
+                        continue
+                    if trail and j == n - 1:
+                        continue
+                    best = rank
+        if best is None:
+            return None
+        return self.patterns[best][1]
+
+    def match_fuzzy(self, text: str):
+        # Returns (intent, score) for the closest pattern, or (None, score) below threshold.
+        rank, score = self.fuzzy.best(text)
+        if rank is None or score < self.fuzzy_threshold:
+            return None, score
+        return self.patterns[rank][1], score
+
+    def score_batch(self, texts, chunk_size: int = 2048):
+        # Offline scoring: returns [(tag or None, score), ...] in input order.
+        # texts should already be normalized the same way as user messages.
+        ranks, scores = self.fuzzy.best_batch(texts, chunk_size=chunk_size)
+        out = []
+        for rank, score in zip(ranks.tolist(), scores.tolist()):
+            if rank < 0 or score < self.fuzzy_threshold:
+                out.append((None, score))
+            else:
+                out.append((self.patterns[rank][1].get("tag", "noanswer"), score))
+        return out
+
+
+# ------------------- Fuzzy fallback (char n-gram TF-IDF) -------------------
+# Every pattern becomes an L2-normalized TF-IDF vector over padded character
+# trigrams, stored column-wise (n-gram -> postings). Scoring a message is one
+# gather + bincount over the postings of its n-grams, i.e. the cosine
+# similarity against all patterns at once. Rows are in rank order, so argmax
+# ties still prefer the longer pattern.
+
+NGRAM = 3
+
+
+def char_ngrams(text: str):
+    grams = []
+    for word in text.split():
+        w = f" {word} "
+        if len(w) <= NGRAM:
+            grams.append(w)
+            continue
+        grams.extend(w[i:i + NGRAM] for i in range(len(w) - NGRAM + 1))
+    return grams
+
+
+class FuzzyMatcher:
+    def __init__(self, patterns):
+        self.n_patterns = len(patterns)
+        self.vocab = {}
+        rows, cols = [], []
+        for row, p in enumerate(patterns):
+            for g in char_ngrams(p):
+                rows.append(row)
+                cols.append(self.vocab.setdefault(g, len(self.vocab)))
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        n_vocab = len(self.vocab)
+
+        # term counts per (pattern, n-gram)
+        cell = rows * max(n_vocab, 1) + cols
+        cell, counts = np.unique(cell, return_counts=True)
+        rows, cols = cell // max(n_vocab, 1), cell % max(n_vocab, 1)
+
+        df = np.bincount(cols, minlength=n_vocab)
+        self.idf = np.log((1 + self.n_patterns) / (1 + df)) + 1.0
+        vals = counts * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=vals * vals, minlength=self.n_patterns))
+        vals = vals / np.where(norms == 0, 1.0, norms)[rows]
+
+        # CSC layout: postings of n-gram j are rows/vals[indptr[j]:indptr[j+1]]
+        order = np.argsort(cols, kind="stable")
+        self.post_rows = rows[order]
+        self.post_vals = vals[order]
+        self.indptr = np.zeros(n_vocab + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=n_vocab), out=self.indptr[1:])
+
+    def _query(self, text: str):
+        # (n-gram ids, weights) of the L2-normalized query vector
+        grams = char_ngrams(text)
+        ids = [self.vocab[g] for g in grams if g in self.vocab]
+        if not ids:
+            return None, None
+        # unknown n-grams still count towards the query's length (at max idf)
+        unknown = len(grams) - len(ids)
+        ids, counts = np.unique(np.asarray(ids, dtype=np.int64), return_counts=True)
+        w = counts * self.idf[ids]
+        norm = np.sqrt(np.dot(w, w) + unknown * (np.log(1 + self.n_patterns) + 1.0) ** 2)
+        return ids, w / norm
+
+    def _gather(self, ids, weights):
+        starts, ends = self.indptr[ids], self.indptr[ids + 1]
+        lengths = ends - starts
+        # flat positions of every posting of every query n-gram
+        pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.post_rows[pos], self.post_vals[pos] * np.repeat(weights, lengths)
+
+    def scores(self, text: str):
+        ids, w = self._query(text)
+        if ids is None:
+            return np.zeros(self.n_patterns)
+        rows, vals = self._gather(ids, w)
+        return np.bincount(rows, weights=vals, minlength=self.n_patterns)
+
+    def best(self, text: str):
+        if not self.n_patterns:
+            return None, 0.0
+        s = self.scores(text)
+        rank = int(np.argmax(s))
+        return rank, float(s[rank])
+
+    def best_batch(self, texts, chunk_size: int = 2048):
+        texts = list(texts)
+        ranks = np.full(len(texts), -1, dtype=np.int64)
+        best = np.zeros(len(texts))
+        if not self.n_patterns:
+            return ranks, best
+
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            all_rows, all_vals = [], []
+            for i, text in enumerate(chunk):
+                ids, w = self._query(text)
+                if ids is None:
+                    continue
+                rows, vals = self._gather(ids, w)
+                all_rows.append(rows + i * self.n_patterns)
+                all_vals.append(vals)
+            if not all_rows:
+                continue
+            flat = np.bincount(
+                np.concatenate(all_rows),
+                weights=np.concatenate(all_vals),
+                minlength=len(chunk) * self.n_patterns,
+            ).reshape(len(chunk), self.n_patterns)
+            r = np.argmax(flat, axis=1)
+            s = flat[np.arange(len(chunk)), r]
+            hit = s > 0
+            ranks[start:start + len(chunk)][hit] = r[hit]
+            best[start:start + len(chunk)] = s
+        return ranks, best
@@ -0,0 +1,245 @@
+import gzip
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from slides import load_fitz
+
+# ------------------- Slide full-text search -------------------
+# Inverted index over the page text of every PDF in pdfs/, ranked with BM25.
+# On disk it is one gzip'd JSON file holding, per PDF, its stat stamp, page
+# lengths, page titles and {term: [page, tf, page, tf, ...]}. Only PDFs whose
+# mtime/size changed are re-extracted; the global term -> postings table is
+# rebuilt in memory from the per-PDF entries.
+#
+# Searches never extract text themselves: the first one loads the saved file,
+# and poll() (at most one round of stat() calls per interval, like
+# ContentStore.poll) starts a background refresh when a PDF was added, edited
+# or removed. Until it finishes, searches use the previous index.
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "its", "me", "of", "on", "or", "show", "that", "the", "this", "to",
+    "what", "when", "where", "which", "who", "why", "with", "you", "about", "explain", "tell",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def _stamp(path: str):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _page_titles(page_texts):
+    # First line of each page that isn't boilerplate repeated on most pages
+    # (headers/footers) or a bare page number.
+    line_sets = [set(l.strip() for l in t.splitlines() if l.strip()) for t in page_texts]
+    seen = Counter(l for s in line_sets for l in s)
+    common = {l for l, n in seen.items() if n > max(2, len(page_texts) // 2)}
+    titles = []
+    for t in page_texts:
+        title = ""
+        for line in t.splitlines():
+            line = line.strip().lstrip("•").strip()
+            if line and line not in common and any(ch.isalpha() for ch in line):
+                title = line[:80]
+                break
+        titles.append(title)
+    return titles
+
+
+def index_pdf(pdf_path: str) -> dict:
+    with load_fitz().open(pdf_path) as doc:
+        page_texts = [page.get_text() for page in doc]
+
+    terms = {}
+    lengths = []
+    for page_num, text in enumerate(page_texts, start=1):
+        tokens = tokenize(text)
+        lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            terms.setdefault(term, []).extend((page_num, tf))
+    return {
+        "stamp": _stamp(pdf_path),
+        "lengths": lengths,
+        "titles": _page_titles(page_texts),
+        "terms": terms,
+    }
+
+
+class SlideSearchIndex:
+    def __init__(self, pdf_dir: str, index_path: str, poll_interval: float = 30.0, extract=index_pdf):
+        # extract(pdf_path) -> index_pdf() entry; the app runs it in the render pool.
+        self.pdf_dir = pdf_dir
+        self.index_path = index_path
+        self.poll_interval = poll_interval
+        self.extract = extract
+        self.docs = {}        # pdf name -> index_pdf() entry
+        self.postings = {}    # term -> [(pdf name, page, tf), ...]
+        self.n_pages = 0
+        self.avg_len = 0.0
+        self._snapshot = (self.docs, self.postings, self.n_pages, self.avg_len)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._next_poll = 0.0
+
+    # ------------------- Build / persist -------------------
+    def _pdf_names(self):
+        try:
+            return sorted(n for n in os.listdir(self.pdf_dir) if n.lower().endswith(".pdf"))
+        except OSError:
+            return []
+
+    def _load_file(self) -> dict:
+        try:
+            with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("docs", {})
+
+    def _save_file(self):
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "docs": self.docs}, f, separators=(",", ":"))
+            os.replace(tmp, self.index_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def load(self):
+        # Publishes whatever the saved file holds, without reading any PDF.
+        with self._lock:
+            if not self._loaded:
+                self._publish(self._load_file())
+                self._loaded = True
+
+    def stale(self) -> bool:
+        docs = self.docs
+        names = self._pdf_names()
+        if set(names) != set(docs):
+            return True
+        for name in names:
+            try:
+                if docs[name].get("stamp") != _stamp(os.path.join(self.pdf_dir, name)):
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def refresh(self, log=None) -> int:
+        # Re-extracts PDFs that are new or changed; returns how many were (re)indexed.
+        # Blocking; use poll() from request paths.
+        with self._refresh_lock:
+            self.load()
+            # another worker may already have saved fresher entries
+            stored = {**self.docs, **self._load_file()}
+            docs, rebuilt = {}, 0
+            for name in self._pdf_names():
+                path = os.path.join(self.pdf_dir, name)
+                entry = stored.get(name)
+                try:
+                    if entry is None or entry.get("stamp") != _stamp(path):
+                        entry = self.extract(path)
+                        rebuilt += 1
+                        if log:
+                            log(f"  indexed {name}: {len(entry['lengths'])} pages, {len(entry['terms'])} terms")
+                except Exception as e:
+                    # keep the old entry (if any); its stamp still differs, so the next poll retries
+                    if log:
+                        log(f"  {name}: not indexed ({type(e).__name__}: {e})")
+                    if entry is None:
+                        continue
+                docs[name] = entry
+            changed = rebuilt or set(docs) != set(stored)
+            with self._lock:
+                self._publish(docs)
+            if changed:
+                self._save_file()
+            return rebuilt
+
+    def _publish(self, docs):
+        postings = {}
+        total_len = 0
+        n_pages = 0
+        for name, entry in docs.items():
+            total_len += sum(entry["lengths"])
+            n_pages += len(entry["lengths"])
+            for term, flat in entry["terms"].items():
+                lst = postings.setdefault(term, [])
+                for i in range(0, len(flat), 2):
+                    lst.append((name, flat[i], flat[i + 1]))
+        avg_len = total_len / n_pages if n_pages else 0.0
+        self.docs, self.postings, self.n_pages, self.avg_len = docs, postings, n_pages, avg_len
+        # search() reads this one tuple, so it never sees half of a swap
+        self._snapshot = (docs, postings, n_pages, avg_len)
+
+    def poll(self):
+        self.load()
+        if self.poll_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        if not self._refresh_lock.locked() and self.stale():
+            threading.Thread(target=self.refresh, daemon=True).start()
+
+    # ------------------- Query -------------------
+    def search(self, query: str, limit: int = 5, min_coverage: float = 0.0):
+        # Returns [{"pdf", "page", "score", "title", "coverage"}, ...] best first.
+        # coverage = share of the query's terms found on the page.
+        self.poll()
+        docs, postings, n_pages, avg_len = self._snapshot
+        terms = list(dict.fromkeys(tokenize(query)))
+        # a bare number ("33", a quiz or menu pick) would only match page numbers
+        if not n_pages or not any(not t.isdigit() for t in terms):
+            return []
+
+        scores = {}
+        matched = {}
+        for term in terms:
+            plist = postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_pages - len(plist) + 0.5) / (len(plist) + 0.5))
+            for name, page, tf in plist:
+                length = docs[name]["lengths"][page - 1]
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_len or 1)))
+                key = (name, page)
+                scores[key] = scores.get(key, 0.0) + idf * norm
+                matched[key] = matched.get(key, 0) + 1
+
+        results = []
+        for (name, page), score in scores.items():
+            coverage = matched[(name, page)] / len(terms)
+            if coverage < min_coverage:
+                continue
+            results.append({
+                "pdf": name,
+                "page": page,
+                "score": round(score, 4),
+                "coverage": round(coverage, 3),
+                "title": docs[name]["titles"][page - 1],
+            })
+        results.sort(key=lambda r: (-r["score"], r["pdf"], r["page"]))
+        return results[:limit]
@@ -0,0 +1,114 @@
+import math
+from array import array
+
+# ------------------- Quiz engine (QUIZ.json compiled at load) -------------------
+# Every category becomes a table of valid questions with the correct option,
+# the question text and the explanation already rendered, so grading is a few
+# index lookups. Questions that can't be asked or graded (no text, fewer than
+# 2 or more than MAX_CHOICES choices, bad answer_index) are left out and
+# listed in QuizBank.problems when the file is loaded.
+#
+# A session stores its position in the quiz plus, when shuffling, one int
+# seed. The seed picks an affine permutation pos -> (a * pos + b) % n with
+# gcd(a, n) == 1, so any position maps to a question in O(1) and the order
+# never has to be stored.
+
+MAX_CHOICES = 4  # answers are typed as 1-4 (see is_quiz_answer in app.py)
+
+
+class QuizCategory:
+    __slots__ = ("name", "header", "tails", "texts", "correct", "explains", "bank_numbers")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.header = f"📘 Quiz: {name}"
+        self.tails = []         # "question\n1) ...\n\nTip: reply 1–4"
+        self.texts = []         # full text when asked in file order
+        self.correct = array("B")
+        self.explains = []      # "\n\nExplanation:\n..." or ""
+        self.bank_numbers = []  # 1-based position in QUIZ.json, for reports
+
+    def __len__(self):
+        return len(self.tails)
+
+    def question_text(self, number: int, idx: int) -> str:
+        # number: 1-based position in this session's order; idx: table row
+        if number == idx + 1:
+            return self.texts[idx]
+        return f"{self.header}\nQ{number}. {self.tails[idx]}"
+
+
+class QuizBank:
+    def __init__(self, categories: dict, problems: list):
+        self.categories = categories  # name -> QuizCategory (only non-empty ones)
+        self.problems = problems      # ["category #n: reason", ...]
+
+    def get(self, name):
+        return self.categories.get(name)
+
+
+def _question_problem(q_obj) -> str:
+    if not isinstance(q_obj, dict):
+        return "not an object"
+    if not isinstance(q_obj.get("q"), str) or not q_obj["q"].strip():
+        return "missing question text 'q'"
+    choices = q_obj.get("choices")
+    if not isinstance(choices, list) or not (2 <= len(choices) <= MAX_CHOICES):
+        return f"'choices' must be a list of 2-{MAX_CHOICES} options"
+    ans = q_obj.get("answer_index")
+    try:
+        ans = int(ans)
+    except (TypeError, ValueError):
+        return f"invalid answer_index {ans!r}"
+    if not 0 <= ans < len(choices):
+        return f"answer_index {ans} out of range for {len(choices)} choices"
+    return ""
+
+
+def compile_quiz(quiz_data: dict) -> QuizBank:
+    categories, problems = {}, []
+    for name, questions in quiz_data.items():
+        if not isinstance(questions, list):
+            problems.append(f"{name}: questions must be a list")
+            continue
+        cat = QuizCategory(name)
+        for n, q_obj in enumerate(questions, start=1):
+            problem = _question_problem(q_obj)
+            if problem:
+                problems.append(f"{name} #{n}: {problem}")
+                continue
+            lines = [q_obj["q"]]
+            for i, c in enumerate(q_obj["choices"], start=1):
+                lines.append(f"{i}) {c}")
+            lines.append("")
+            lines.append("Tip: reply 1–4")
+            tail = "\n".join(lines)
+            explain = (q_obj.get("explain") or "").strip()
+
+            cat.tails.append(tail)
+            cat.texts.append(f"{cat.header}\nQ{len(cat.tails)}. {tail}")
+            cat.correct.append(int(q_obj["answer_index"]) + 1)
+            cat.explains.append(f"\n\nExplanation:\n{explain}" if explain else "")
+            cat.bank_numbers.append(n)
+        if len(cat):
+            categories[name] = cat
+        elif questions:
+            problems.append(f"{name}: no valid questions")
+    return QuizBank(categories, problems)
+
+
+# ------------------- Question order -------------------
+def quiz_length(n: int, sample: int = 0) -> int:
+    return min(n, sample) if sample > 0 else n
+
+
+def question_index(n: int, pos: int, seed=None) -> int:
+    # Table row asked at position pos (0-based) for this seed; identity when
+    # the quiz isn't shuffled.
+    if seed is None or n < 2:
+        return pos
+    a = 1 + seed % (n - 1)
+    while math.gcd(a, n) != 1:
+        a += 1
+    b = (seed // n) % n
+    return (a * pos + b) % n
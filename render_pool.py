@@ -0,0 +1,106 @@
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# ------------------- Render isolation -------------------
+# PyMuPDF rasterization runs in a small dedicated process pool so a burst of
+# slide renders can't pin every web worker thread. Admission is bounded: at
+# most (workers + queue_size) renders are running or waiting; beyond that the
+# caller gets RenderBusy immediately instead of queueing forever.
+#
+# Each web worker has only a few request threads, so waiters also caps how
+# many of them may block on slides at once: rendering, or waiting for another
+# thread's render of the same slide. Keep it below the worker's thread count
+# and there is always a thread left for text routes.
+#
+# Render processes are spawned, not forked: pools are created from threaded
+# gthread workers and from the warm-up thread in the --preload master, and a
+# forked child can inherit a lock another thread held at fork time. (A
+# forkserver started in the master can't be used by the forked workers.)
+# Render functions live in slides.py, which is all a child needs to import.
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class RenderBusy(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class RenderPool:
+    def __init__(self, workers: int = 2, queue_size: int = 8, timeout: float = 20.0, waiters: int = 0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, workers) + max(0, queue_size))
+        # waiters=0: no limit on request threads waiting (see waiting())
+        self._waiters = threading.BoundedSemaphore(waiters) if waiters > 0 else None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # created lazily so each (forked) web worker gets its own children
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=MP_CONTEXT)
+            return self._pool
+
+    def _reset(self, broken):
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def try_wait(self) -> bool:
+        # Claims a waiter slot without blocking; pair with end_wait().
+        return self._waiters is None or self._waiters.acquire(blocking=False)
+
+    def end_wait(self):
+        if self._waiters is not None:
+            self._waiters.release()
+
+    @contextmanager
+    def waiting(self):
+        # Wrap everything a request thread may block on for a render (including
+        # the cache's single-flight wait); RenderBusy when no waiter slot is free.
+        if not self.try_wait():
+            raise RenderBusy()
+        try:
+            yield
+        finally:
+            self.end_wait()
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)  # inline rendering (RENDER_WORKERS=0)
+
+        if not self._slots.acquire(blocking=False):
+            raise RenderBusy()
+
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset(pool)
+            raise RenderBusy()
+        # the slot is held until the render really finishes, even after a timeout
+        future.add_done_callback(lambda _f: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise RenderTimeout()
+        except BrokenProcessPool:
+            self._reset(pool)
+            raise RenderBusy()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,211 @@
+import math
+import re
+
+import numpy as np
+
+# ------------------- Resistor networks -------------------
+# Expressions join values with "+" (series) and "||" or "//" (parallel), with
+# parentheses for grouping. "||" binds tighter than "+", so "10+20||30" is
+# 10 + (20||30). Values may carry an SI suffix (4.7k, 1M, 220m) and a trailing
+# "Ω"/"ohm". As with the plain values list in /api/resistors, a parallel group
+# with a 0 Ω branch is invalid; so is a total too large for a float.
+#
+# Networks are parsed into trees and compiled into flat tables: all leaf
+# values in one array, and internal nodes grouped by height. Evaluation is
+# then one np.add.reduceat per height and operator, for any number of
+# networks at once.
+
+SERIES = "+"
+PARALLEL = "||"
+SUFFIXES = {"": 1.0, "m": 1e-3, "k": 1e3, "K": 1e3, "M": 1e6, "G": 1e9}
+ZERO_PARALLEL_ERROR = "Invalid because a resistor in a parallel group is 0 Ω."
+NOT_FINITE_ERROR = "Result is not a finite number."
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:"
+    r"(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)(?P<suffix>[mkKMG]?)\s*(?:Ω|ohms?)?"
+    r"|(?P<op>\|\||//|\+|\(|\))"
+    r"|(?P<bad>\S)"
+    r")"
+)
+_EXPONENT_RE = re.compile(r"(?<=[\d.])[eE][+-](?=\d)")
+
+
+class NetworkError(ValueError):
+    pass
+
+
+# ------------------- Parsing -------------------
+def tokenize(text: str):
+    # [(kind, value, position, text as typed), ...]
+    text = text or ""
+    tokens = []
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "num" or kind == "suffix":
+            value = float(m.group("num")) * SUFFIXES[m.group("suffix")]
+            if not math.isfinite(value):
+                raise NetworkError(f"Value too large at position {m.start('num') + 1}.")
+            tokens.append(("num", value, m.start("num"), text[m.start("num"):m.end()].rstrip()))
+        elif kind == "op":
+            op = m.group("op")
+            tokens.append(("op", PARALLEL if op == "//" else op, m.start("op"), op))
+        elif kind == "bad":
+            raise NetworkError(f"Unexpected '{m.group('bad')}' at position {m.start('bad') + 1}.")
+    return tokens
+
+
+class _Parser:
+    # network := series ; series := parallel ("+" parallel)* ;
+    # parallel := term ("||" term)* ; term := number | "(" series ")"
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def parse(self):
+        if not self.tokens:
+            raise NetworkError("Empty network.")
+        node = self.group(SERIES, self.parallel)
+        tok = self.peek()
+        if tok is not None:
+            raise NetworkError(f"Unexpected '{tok[3]}' at position {tok[2] + 1}.")
+        return node
+
+    def group(self, op, operand):
+        children = [operand()]
+        while (tok := self.peek()) is not None and tok[0] == "op" and tok[1] == op:
+            self.i += 1
+            children.append(operand())
+        if len(children) == 1:
+            return children[0]
+        # flatten a+(b+c) into one n-ary node
+        flat = []
+        for child in children:
+            flat.extend(child[1] if isinstance(child, tuple) and child[0] == op else [child])
+        return (op, flat)
+
+    def parallel(self):
+        return self.group(PARALLEL, self.term)
+
+    def term(self):
+        tok = self.peek()
+        if tok is None:
+            raise NetworkError("Network ends too early.")
+        self.i += 1
+        if tok[0] == "num":
+            return tok[1]
+        if tok[1] == "(":
+            node = self.group(SERIES, self.parallel)
+            close = self.peek()
+            if close is None or close[1] != ")":
+                raise NetworkError(f"Missing ')' for '(' at position {tok[2] + 1}.")
+            self.i += 1
+            return node
+        raise NetworkError(f"Unexpected '{tok[3]}' at position {tok[2] + 1}.")
+
+
+def parse_network(text: str):
+    # Returns a float (single resistor) or (op, [children]).
+    try:
+        return _Parser(tokenize(text)).parse()
+    except RecursionError:
+        raise NetworkError("Network is nested too deeply.")
+
+
+# ------------------- Vectorized evaluation -------------------
+def _compile(trees):
+    # Returns (leaf values, {height: (op, node ids, child ids, starts)}, root ids).
+    leaves = []
+    nodes = []   # (op, height, child ids) - ids index leaves first, then nodes
+    pending = []
+
+    def visit(node):
+        if not isinstance(node, tuple):
+            leaves.append(node)
+            return ("leaf", len(leaves) - 1), 0
+        op, children = node
+        refs, height = [], 0
+        for child in children:
+            ref, h = visit(child)
+            refs.append(ref)
+            height = max(height, h)
+        nodes.append((op, height + 1, refs))
+        return ("node", len(nodes) - 1), height + 1
+
+    for tree in trees:
+        pending.append(visit(tree)[0])
+
+    n_leaves = len(leaves)
+    resolve = lambda ref: ref[1] if ref[0] == "leaf" else n_leaves + ref[1]  # noqa: E731
+
+    levels = {}
+    for node_id, (op, height, refs) in enumerate(nodes):
+        ids, children, starts = levels.setdefault((height, op), ([], [], []))
+        ids.append(n_leaves + node_id)
+        starts.append(len(children))
+        children.extend(resolve(r) for r in refs)
+
+    plan = [
+        (op, np.array(ids, dtype=np.intp), np.array(children, dtype=np.intp), np.array(starts, dtype=np.intp))
+        for (height, op), (ids, children, starts) in sorted(levels.items(), key=lambda kv: kv[0][0])
+    ]
+    roots = np.array([resolve(ref) for ref in pending], dtype=np.intp)
+    return np.array(leaves, dtype=np.float64), n_leaves + len(nodes), plan, roots
+
+
+def evaluate_trees(trees):
+    # Total resistance (ohms) of each parsed network, as a float array: NaN
+    # when a parallel group has a 0 Ω branch, inf when the total overflows.
+    if not trees:
+        return np.empty(0)
+    leaves, size, plan, roots = _compile(trees)
+    values = np.empty(size, dtype=np.float64)
+    values[:len(leaves)] = leaves
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        for op, ids, children, starts in plan:
+            if op == SERIES:
+                values[ids] = np.add.reduceat(values[children], starts)
+            else:
+                inverse = np.add.reduceat(1.0 / values[children], starts)
+                # a 0 Ω branch gives 1/0 = inf here; NaN then carries up to the root
+                values[ids] = np.where(np.isinf(inverse), np.nan, 1.0 / inverse)
+    return values[roots]
+
+
+def _value_error(ohms: float) -> str:
+    return ZERO_PARALLEL_ERROR if math.isnan(ohms) else NOT_FINITE_ERROR
+
+
+def evaluate_network(text: str) -> float:
+    total = float(evaluate_trees([parse_network(text)])[0])
+    if not math.isfinite(total):
+        raise NetworkError(_value_error(total))
+    return total
+
+
+def evaluate_networks(texts):
+    # Returns [(ohms or None, error message or None), ...] in input order.
+    # Networks that fail to parse don't stop the others from being evaluated.
+    trees, slots, results = [], [], []
+    for text in texts:
+        try:
+            trees.append(parse_network(text))
+            slots.append(len(results))
+            results.append(None)
+        except NetworkError as e:
+            results.append((None, str(e)))
+    for slot, ohms in zip(slots, evaluate_trees(trees).tolist()):
+        results[slot] = (ohms, None) if math.isfinite(ohms) else (None, _value_error(ohms))
+    return results
+
+
+def looks_like_network(text: str) -> bool:
+    # A comma list ("10,1e+3") is the plain values list, and the + in an
+    # exponent isn't the series operator.
+    if "," in text:
+        return False
+    text = _EXPONENT_RE.sub("e", text)
+    return any(op in text for op in ("+", "||", "//", "("))
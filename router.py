@@ -0,0 +1,104 @@
+# ------------------- Chat router (table-driven dispatch for /chat) -------------------
+# Rules are declared as data and compiled into lookup tables. Dispatch order
+# mirrors the original if-chain in chat():
+#
+#   1. exact commands on the raw message ("/clear", "/topic", "/quiz")   dict
+#   2. "before" state rules (quiz pick, quiz answer)                      in order
+#   3. first-word commands ("explain <gate>")                             dict
+#   4. topic keywords (spaces ignored) and topic prefixes                 dict + first-char buckets
+#   5. "after" state rules (formula yes/no, topic pick)                   in order
+#   6. fallback
+#
+# A handler returns a reply, or None to let later rules try.
+
+
+class ChatContext:
+    __slots__ = ("msg", "msg_raw", "msg_clean", "compact", "first_word", "payload", "content", "state")
+
+    def __init__(self, msg: str, msg_clean: str, payload: dict, content, state):
+        self.msg = msg
+        self.msg_raw = msg.strip().lower()
+        self.msg_clean = msg_clean
+        self.compact = msg_clean.replace(" ", "")
+        words = msg_clean.split()
+        self.first_word = words[0] if words else ""
+        self.payload = payload
+        self.content = content
+        self.state = state  # convo_state.ConversationState
+
+
+class ChatRouter:
+    def __init__(self):
+        self.commands = {}      # raw message -> (name, handler)
+        self.first_words = {}   # first word of msg_clean -> (name, handler)
+        self.keywords = {}      # msg_clean without spaces -> (priority, name, handler)
+        self.prefixes = {}      # first char -> [(priority, prefix, name, handler)]
+        self.before = []        # [(name, when, handler)]
+        self.after = []
+        self.fallback = None
+        self._topics = 0
+
+    # ------------------- Declaring rules -------------------
+    def command(self, text: str, name: str, handler):
+        self.commands[text] = (name, handler)
+
+    def first_word(self, word: str, name: str, handler):
+        self.first_words[word] = (name, handler)
+
+    def topic(self, name: str, handler, keywords=(), prefixes=()):
+        # Earlier topics win when a message matches more than one.
+        priority = self._topics
+        self._topics += 1
+        for k in keywords:
+            self.keywords.setdefault(k.replace(" ", ""), (priority, name, handler))
+        for p in prefixes:
+            self.prefixes.setdefault(p[0], []).append((priority, p, name, handler))
+
+    def state(self, name: str, when, handler, after_topics: bool = False):
+        (self.after if after_topics else self.before).append((name, when, handler))
+
+    def set_fallback(self, name: str, handler):
+        self.fallback = (name, handler)
+
+    # ------------------- Dispatch -------------------
+    def _topic_match(self, ctx: ChatContext):
+        best = self.keywords.get(ctx.compact)
+        for rule in self.prefixes.get(ctx.msg_clean[:1], ()):
+            if (best is None or rule[0] < best[0]) and ctx.msg_clean.startswith(rule[1]):
+                best = (rule[0], rule[2], rule[3])
+        return best
+
+    def dispatch(self, ctx: ChatContext):
+        # Returns (rule name, reply).
+        hit = self.commands.get(ctx.msg_raw)
+        if hit:
+            reply = hit[1](ctx)
+            if reply is not None:
+                return hit[0], reply
+
+        for name, when, handler in self.before:
+            if when(ctx):
+                reply = handler(ctx)
+                if reply is not None:
+                    return name, reply
+
+        hit = self.first_words.get(ctx.first_word)
+        if hit:
+            reply = hit[1](ctx)
+            if reply is not None:
+                return hit[0], reply
+
+        topic = self._topic_match(ctx)
+        if topic:
+            reply = topic[2](ctx)
+            if reply is not None:
+                return topic[1], reply
+
+        for name, when, handler in self.after:
+            if when(ctx):
+                reply = handler(ctx)
+                if reply is not None:
+                    return name, reply
+
+        name, handler = self.fallback
+        return name, handler(ctx)
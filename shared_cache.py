@@ -0,0 +1,307 @@
+import errno
+import fcntl
+import glob
+import hashlib
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+# ------------------- Shared slide cache (all workers on a host) -------------------
+# One append-only blob file holds the rendered images and a small index file
+# maps sha1(cache key) -> (offset, length) in it:
+#
+#   slides.idx           header (magic, generation) + 32-byte records, append-only
+#   slides.<gen>.blob    image bytes, append-only
+#   slides.lock          fcntl byte-range locks: byte 0 guards appends and
+#                        compaction, bytes 1..FLIGHT_SLOTS make renders single-flight
+#
+# Readers never lock: a record is appended only after its bytes are in the
+# blob, and each process picks up new records by reading the index from where
+# it stopped. A hit is a BlobSlice over a read-only mmap of the blob, so the
+# page cache holds one copy for every worker; under gunicorn the response is
+# sendfile()d from those same pages without copying it through Python.
+#
+# When an append would push the blob past max_bytes, the newest entries that
+# fit in half the budget are copied into a new generation (new blob + index,
+# swapped in with os.replace). Older generations stay readable through
+# existing mmaps until those are dropped.
+
+MAGIC = b"SLC1"
+HEADER = struct.Struct("<4sQ")       # magic, generation
+RECORD = struct.Struct("<20sQI")     # sha1 digest, offset, length
+FLIGHT_SLOTS = 1024
+
+
+def key_digest(key) -> bytes:
+    return hashlib.sha1(repr(key).encode("utf-8")).digest()
+
+
+class BlobSlice:
+    # File-like window onto one cached image. view is a zero-copy memoryview
+    # of the mmap; fileno() (an fd already positioned at the entry, when one
+    # could be opened) lets wsgi.file_wrapper sendfile() it, and read() serves
+    # servers without that in chunks.
+    def __init__(self, view: memoryview, fd=None):
+        self.view = view
+        self._fd = fd
+        self._pos = 0
+
+    def __len__(self):
+        return len(self.view)
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else min(len(self.view), self._pos + size)
+        chunk = bytes(self.view[self._pos:end])
+        self._pos = end
+        return chunk
+
+    def fileno(self) -> int:
+        if self._fd is None:
+            raise io.UnsupportedOperation("fileno")
+        return self._fd
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+
+class SharedSlideCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.idx_path = os.path.join(cache_dir, "slides.idx")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(cache_dir, "slides.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._make_locks()
+        # gunicorn --preload forks workers after the warm-up thread may have
+        # taken a lock; each worker starts with fresh ones.
+        os.register_at_fork(after_in_child=self._make_locks)
+
+        self._index = {}
+        self._idx_fd = None
+        self._idx_ino = None
+        self._idx_pos = 0
+        self._blob_fd = None
+        self._generation = None
+        self._map = None
+
+        with self._write_lock, self._locked_file(0):
+            if not os.path.exists(self.idx_path):
+                self._write_generation(0, [])
+            self._refresh()
+            if self._blob_fd is None:
+                self._recover()
+
+    # ------------------- Locking -------------------
+    def _make_locks(self):
+        self._lock = threading.RLock()     # guards this process's view of the files
+        self._write_lock = threading.Lock()
+        self._flight_locks = [threading.Lock() for _ in range(FLIGHT_SLOTS)]
+
+    @contextmanager
+    def _locked_file(self, slot: int):
+        # fcntl locks belong to the process, so threads are serialized first.
+        # The lock fd is never closed: closing any fd of the lock file would
+        # drop every lock this process holds on it.
+        while True:
+            try:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, slot)
+                break
+            except OSError as e:
+                # The kernel sees all threads of a process as one lock owner and
+                # can report a deadlock that isn't one (locks are always taken
+                # flight slot first, then byte 0), so just try again.
+                if e.errno != errno.EDEADLK:
+                    raise
+                time.sleep(0.001)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot)
+
+    @contextmanager
+    def single_flight(self, key):
+        # Only one thread on the host runs the block for a given key at a time.
+        slot = 1 + int.from_bytes(key_digest(key)[:4], "little") % FLIGHT_SLOTS
+        with self._flight_locks[slot - 1], self._locked_file(slot):
+            yield
+
+    # ------------------- Index / blob view -------------------
+    def _blob_path(self, generation: int) -> str:
+        return os.path.join(self.cache_dir, f"slides.{generation}.blob")
+
+    def _refresh(self):
+        # Catch up with records other processes appended, or switch to a new
+        # generation after a compaction.
+        with self._lock:
+            for _attempt in range(3):
+                try:
+                    st = os.stat(self.idx_path)
+                    if st.st_ino != self._idx_ino:
+                        self._open_generation()
+                        st = os.fstat(self._idx_fd)
+                    self._read_records(st.st_size)
+                    return
+                except FileNotFoundError:
+                    continue  # compacted between stat and open; look again
+            # still missing: the blob is gone, and put() or __init__ recovers
+
+    def _open_generation(self):
+        fd = os.open(self.idx_path, os.O_RDWR | os.O_APPEND)
+        try:
+            magic, generation = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+            if magic != MAGIC:
+                raise ValueError(f"{self.idx_path} is not a slide cache index")
+            blob_fd = os.open(self._blob_path(generation), os.O_RDWR)
+        except BaseException:
+            os.close(fd)
+            raise
+        for old in (self._idx_fd, self._blob_fd):
+            if old is not None:
+                os.close(old)
+        self._idx_fd, self._blob_fd = fd, blob_fd
+        self._idx_ino = os.fstat(fd).st_ino
+        self._idx_pos = HEADER.size
+        self._generation = generation
+        self._index = {}
+        self._map = None  # old map stays alive while responses still use it
+
+    def _recover(self):
+        # The index names a blob that no longer exists (a /tmp cleaner, say):
+        # start a new, empty generation. Called with the write lock held.
+        try:
+            with open(self.idx_path, "rb") as f:
+                _magic, generation = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            generation = self._generation or 0
+        self._write_generation(generation + 1, [])
+        self._refresh()
+
+    def _read_records(self, size: int):
+        end = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+        if end <= self._idx_pos:
+            return
+        raw = os.pread(self._idx_fd, end - self._idx_pos, self._idx_pos)
+        index = self._index
+        for digest, offset, length in RECORD.iter_unpack(raw):
+            index[digest] = (offset, length)
+        self._idx_pos = end
+
+    def _view(self, offset: int, length: int):
+        # Call with self._lock held, so the entry and the map are from the same generation.
+        if not length:
+            return memoryview(b"")
+        mapped = self._map
+        if mapped is None or offset + length > len(mapped):
+            # the blob only grows within a generation, so remap larger
+            mapped = self._map = mmap.mmap(self._blob_fd, 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[offset:offset + length]
+
+    def _lookup(self, digest: bytes):
+        entry = self._index.get(digest)
+        if entry is None:
+            self._refresh()
+            entry = self._index.get(digest)
+        return entry
+
+    # ------------------- SlideCache interface -------------------
+    def get(self, key):
+        # Returns a BlobSlice of the cached image, or None.
+        digest = key_digest(key)
+        with self._lock:
+            entry = self._lookup(digest)
+            if entry is None:
+                return None
+            offset, length = entry
+            view = self._view(offset, length)
+            try:
+                fd = os.open(self._blob_path(self._generation), os.O_RDONLY)
+            except OSError:
+                fd = None  # compacted away just now; the mmap still has it
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+        return BlobSlice(view, fd)
+
+    def contains(self, key) -> bool:
+        return self._lookup(key_digest(key)) is not None
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes // 2:
+            return
+        digest = key_digest(key)
+        with self._write_lock, self._locked_file(0):
+            self._refresh()
+            if self._blob_fd is None:
+                self._recover()
+            if digest in self._index:
+                return
+            offset = os.fstat(self._blob_fd).st_size
+            if offset + len(data) > self.max_bytes:
+                self._compact(self.max_bytes // 2 - len(data))
+                offset = os.fstat(self._blob_fd).st_size
+            os.pwrite(self._blob_fd, data, offset)
+            # the record goes in only after its bytes, so readers never see a hole
+            os.write(self._idx_fd, RECORD.pack(digest, offset, len(data)))
+            with self._lock:
+                self._index[digest] = (offset, len(data))
+                self._idx_pos += RECORD.size
+
+    def get_or_render(self, key, render):
+        # Returns (data or None, "hit" | "miss" | "waited"). On a miss only one
+        # worker on the host calls render(); the others wait and read its result.
+        data = self.get(key)
+        if data is not None:
+            return data, "hit"
+        with self.single_flight(key):
+            data = self.get(key)
+            if data is not None:
+                return data, "waited"
+            data = render()
+            if data is None:
+                return None, "miss"
+            self.put(key, data)
+            return self.get(key) or data, "miss"
+
+    # ------------------- Compaction -------------------
+    def _write_generation(self, generation: int, entries):
+        # entries: [(digest, bytes-like)] -> new blob + index, then swap the index in.
+        blob_path = self._blob_path(generation)
+        with open(blob_path, "wb") as blob, open(self.idx_path + ".tmp", "wb") as idx:
+            idx.write(HEADER.pack(MAGIC, generation))
+            offset = 0
+            for digest, data in entries:
+                blob.write(data)
+                idx.write(RECORD.pack(digest, offset, len(data)))
+                offset += len(data)
+        os.replace(self.idx_path + ".tmp", self.idx_path)
+        for path in glob.glob(os.path.join(self.cache_dir, "slides.*.blob")):
+            if path != blob_path:
+                os.remove(path)
+
+    def _compact(self, budget: int):
+        # Keep the newest entries that fit in budget (called with the write lock held).
+        newest_first = sorted(self._index.items(), key=lambda item: item[1][0], reverse=True)
+        keep, total = [], 0
+        for digest, (offset, length) in newest_first:
+            if total + length > budget:
+                break
+            with self._lock:
+                keep.append((digest, bytes(self._view(offset, length))))
+            total += length
+        keep.reverse()
+        self._write_generation(self._generation + 1, keep)
+        self._refresh()
+
+    def stats(self) -> dict:
+        self._refresh()
+        size = os.fstat(self._blob_fd).st_size if self._blob_fd is not None else 0
+        return {"generation": self._generation, "entries": len(self._index), "bytes": size,
+                "max_bytes": self.max_bytes}
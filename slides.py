@@ -0,0 +1,423 @@
+import hashlib
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from io import BytesIO
+
+from render_pool import MP_CONTEXT
+
+# PyMuPDF (~0.3s to import) and Pillow are only loaded by the first render, so
+# workers that never serve a PDF never pay for them. Pillow is optional: it is
+# only needed for WebP output.
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def _lazy(name: str):
+    mod = _modules.get(name)
+    if mod is None:
+        with _modules_lock:
+            mod = _modules.get(name)
+            if mod is None:
+                mod = _modules[name] = importlib.import_module(name)
+    return mod
+
+
+def load_fitz():
+    return _lazy("fitz")
+
+
+def fitz_loaded() -> bool:
+    return "fitz" in _modules
+
+# ------------------- Rendered-slide cache -------------------
+# Keys are (pdf name, mtime_ns, size, page, resolution, format): editing or replacing
+# a PDF changes its stat, so stale renders are never served.
+
+DEFAULT_DPI = 150
+DEFAULT_FORMAT = "png"
+MIMETYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+FORMATS = ("png", "jpeg", "webp") if HAS_PIL else ("png", "jpeg")
+JPEG_QUALITY = 80
+WEBP_QUALITY = 80
+
+# Only these resolutions are ever rendered, so query strings can't grow the cache
+# without bound. A resolution is either a dpi (int) or a target width ("w640").
+DPI_CHOICES = (72, 100, 150, 200)
+WIDTH_CHOICES = (320, 640, 960, 1280)
+THUMB_WIDTH = 320
+
+
+def _nearest(value: int, choices) -> int:
+    return min(choices, key=lambda c: (abs(c - value), c))
+
+
+def clamp_resolution(dpi=None, width=None, thumb: bool = False):
+    # Returns a cache-safe resolution: an allowed dpi or "w<allowed width>".
+    if thumb:
+        return f"w{THUMB_WIDTH}"
+    if width is not None:
+        return f"w{_nearest(width, WIDTH_CHOICES)}"
+    if dpi is not None:
+        return _nearest(dpi, DPI_CHOICES)
+    return DEFAULT_DPI
+
+
+def negotiate_format(requested: str, accept_mimetypes=None):
+    # "auto" picks WebP when the browser takes it (and Pillow is installed), else JPEG.
+    requested = (requested or DEFAULT_FORMAT).lower()
+    if requested == "jpg":
+        requested = "jpeg"
+    if requested == "auto":
+        if "webp" in FORMATS and accept_mimetypes is not None and accept_mimetypes["image/webp"]:
+            return "webp"
+        return "jpeg"
+    if requested == "webp" and "webp" not in FORMATS:
+        return "jpeg"
+    return requested if requested in FORMATS else None
+
+
+def slide_key(pdf_path: str, page_num: int, res=DEFAULT_DPI, fmt: str = DEFAULT_FORMAT):
+    st = os.stat(pdf_path)
+    return (os.path.basename(pdf_path), st.st_mtime_ns, st.st_size, int(page_num), res, fmt)
+
+
+def bundle_key(pdf_path: str, pages, columns: int, res, fmt: str):
+    st = os.stat(pdf_path)
+    return (os.path.basename(pdf_path), st.st_mtime_ns, st.st_size, ("bundle", tuple(pages), columns), res, fmt)
+
+
+def slide_etag(key) -> str:
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class SlideCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: str = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight_locks = [threading.Lock() for _ in range(64)]
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{slide_etag(key)}.{key[5]}")
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data: bytes):
+        self._remember(key, data)
+        if self.cache_dir:
+            path = self._disk_path(key)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _remember(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _k, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            if key in self._items:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._disk_path(key))
+
+    def get_or_render(self, key, render):
+        # Returns (data or None, "hit" | "miss" | "waited"). Threads asking for
+        # the same missing key wait for the first one's render instead of
+        # repeating it. (shared_cache.SharedSlideCache does this across processes.)
+        data = self.get(key)
+        if data is not None:
+            return data, "hit"
+        with self._flight_locks[hash(key) % len(self._flight_locks)]:
+            data = self.get(key)
+            if data is not None:
+                return data, "waited"
+            data = render()
+            if data is not None:
+                self.put(key, data)
+            return data, "miss"
+
+
+# ------------------- Open-document pool -------------------
+# Re-opening a PDF re-parses its xref on every render, so each process keeps a
+# few fitz.Document handles open. A handle is dropped when the file's
+# mtime/size changes. PyMuPDF is not thread-safe (and holds the GIL while
+# rendering anyway), so all fitz work in a process goes through FITZ_LOCK.
+
+FITZ_LOCK = threading.RLock()
+
+
+class _PooledDocument:
+    def __init__(self, path: str, stamp):
+        self.stamp = stamp
+        self.doc = load_fitz().open(path)
+        self.lock = FITZ_LOCK
+
+    def close(self):
+        with self.lock:
+            self.doc.close()
+
+
+class DocumentPool:
+    def __init__(self, max_open: int = 4):
+        self.max_open = max(1, max_open)
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, path: str):
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        stale = []
+        with self._lock:
+            entry = self._docs.get(path)
+            if entry is not None and entry.stamp != stamp:
+                stale.append(self._docs.pop(path))
+                entry = None
+            if entry is None:
+                with FITZ_LOCK:
+                    entry = _PooledDocument(path, stamp)
+                self._docs[path] = entry
+            self._docs.move_to_end(path)
+            while len(self._docs) > self.max_open:
+                _p, old = self._docs.popitem(last=False)
+                stale.append(old)
+
+        # close outside the pool lock; waits for any thread still rendering
+        for old in stale:
+            old.close()
+
+        with entry.lock:
+            if entry.doc.is_closed:
+                # evicted between lookup and lock: use a private handle
+                with load_fitz().open(path) as doc:
+                    yield doc
+            else:
+                yield entry.doc
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._docs.values())
+            self._docs.clear()
+        for entry in entries:
+            entry.close()
+
+
+documents = DocumentPool(max_open=int(os.environ.get("PDF_OPEN_HANDLES", 4)))
+
+
+# ------------------- Rendering -------------------
+def encode_pixmap(pix, fmt: str) -> bytes:
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+    if fmt == "webp":
+        img = _lazy("PIL.Image").frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buf = BytesIO()
+        img.save(buf, "WEBP", quality=WEBP_QUALITY)
+        return buf.getvalue()
+    return pix.tobytes("png")
+
+
+def _lap(stages: dict, name: str, t0: float) -> float:
+    now = time.perf_counter()
+    stages[name] = now - t0
+    return now
+
+
+def render_page_timed(pdf_path: str, page_num: int, res=DEFAULT_DPI, fmt: str = DEFAULT_FORMAT):
+    # Returns (encoded image bytes or None if the page does not exist,
+    # {stage: seconds}) for open / load_page / get_pixmap / encode.
+    stages = {}
+    t = time.perf_counter()
+    with documents.borrow(pdf_path) as doc:
+        t = _lap(stages, "open", t)
+        if page_num < 1 or page_num > doc.page_count:
+            return None, stages
+        page = doc.load_page(page_num - 1)
+        t = _lap(stages, "load_page", t)
+        if isinstance(res, str) and res.startswith("w"):
+            zoom = int(res[1:]) / page.rect.width
+            pix = page.get_pixmap(matrix=load_fitz().Matrix(zoom, zoom))
+        else:
+            pix = page.get_pixmap(dpi=res)
+        t = _lap(stages, "get_pixmap", t)
+    data = encode_pixmap(pix, fmt)
+    _lap(stages, "encode", t)
+    return data, stages
+
+
+def render_page(pdf_path: str, page_num: int, res=DEFAULT_DPI, fmt: str = DEFAULT_FORMAT):
+    # Returns encoded image bytes, or None if the page does not exist.
+    return render_page_timed(pdf_path, page_num, res, fmt)[0]
+
+
+# ------------------- Bundles (contact sheet of a slide range) -------------------
+BUNDLE_MAX_PAGES = 24
+BUNDLE_COLUMNS = 2
+BUNDLE_MAX_COLUMNS = 4
+BUNDLE_TILE_WIDTH = 640
+
+
+def parse_page_list(spec: str, max_pages: int = BUNDLE_MAX_PAGES):
+    # "41,44-56" -> [41, 44, 45, ...]; None if malformed or too many pages.
+    pages = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        if not lo.isdigit() or (hi and not hi.isdigit()):
+            return None
+        lo = int(lo)
+        hi = int(hi) if hi else lo
+        if lo < 1 or hi < lo or hi - lo >= max_pages:
+            return None
+        pages.extend(range(lo, hi + 1))
+        if len(pages) > max_pages:
+            return None
+    return pages or None
+
+
+def format_page_list(pages) -> str:
+    # [41, 44, 45, 46] -> "41,44-46"
+    parts = []
+    start = prev = None
+    for p in pages:
+        if prev is not None and p == prev + 1:
+            prev = p
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}-{prev}")
+        start = prev = p
+    if start is not None:
+        parts.append(str(start) if start == prev else f"{start}-{prev}")
+    return ",".join(parts)
+
+
+def render_bundle_timed(pdf_path: str, pages, columns: int, res: str, fmt: str):
+    # Tiles the pages into a grid on one vector page, then rasterizes once.
+    # res is a tile width ("w640"). Returns (bytes or None if any page does
+    # not exist, {stage: seconds}) like render_page_timed.
+    stages = {}
+    t = time.perf_counter()
+    with documents.borrow(pdf_path) as src:
+        t = _lap(stages, "open", t)
+        if any(p < 1 or p > src.page_count for p in pages):
+            return None, stages
+        first = src.load_page(pages[0] - 1).rect
+        tile_w, tile_h = first.width, first.height
+        rows = -(-len(pages) // columns)
+
+        fitz = load_fitz()
+        with fitz.open() as sheet:
+            page = sheet.new_page(width=tile_w * columns, height=tile_h * rows)
+            for i, p in enumerate(pages):
+                row, col = divmod(i, columns)
+                rect = fitz.Rect(col * tile_w, row * tile_h, (col + 1) * tile_w, (row + 1) * tile_h)
+                page.show_pdf_page(rect, src, p - 1)
+            t = _lap(stages, "load_page", t)
+            zoom = int(res[1:]) / tile_w
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            t = _lap(stages, "get_pixmap", t)
+    data = encode_pixmap(pix, fmt)
+    _lap(stages, "encode", t)
+    return data, stages
+
+
+def render_bundle(pdf_path: str, pages, columns: int, res: str, fmt: str):
+    return render_bundle_timed(pdf_path, pages, columns, res, fmt)[0]
+
+
+# ------------------- Warm-up (pre-render into the cache) -------------------
+def _timed_render(pdf_path: str, page_num: int, res, fmt: str):
+    t0 = time.perf_counter()
+    data = render_page(pdf_path, page_num, res, fmt)
+    return data, time.perf_counter() - t0
+
+
+def warm_slides(cache: SlideCache, jobs, workers: int = None, log=print):
+    # jobs: iterable of (pdf_path, page_num, res, fmt).
+    # Returns {"rendered": n, "skipped": n, "failed": n, "seconds": total wall time}.
+    started = time.perf_counter()
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    todo = []
+    for pdf_path, page_num, res, fmt in jobs:
+        name = os.path.basename(pdf_path)
+        if not os.path.exists(pdf_path):
+            log(f"  {name} p{page_num}: missing PDF, skipped")
+            stats["failed"] += 1
+            continue
+        key = slide_key(pdf_path, page_num, res, fmt)
+        if cache.contains(key):
+            log(f"  {name} p{page_num}: cached")
+            stats["skipped"] += 1
+            continue
+        todo.append((key, pdf_path, page_num, res, fmt))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as pool:
+            futures = {
+                pool.submit(_timed_render, pdf_path, page_num, res, fmt): (key, page_num)
+                for key, pdf_path, page_num, res, fmt in todo
+            }
+            for fut in as_completed(futures):
+                key, page_num = futures[fut]
+                try:
+                    data, seconds = fut.result()
+                except Exception as e:
+                    log(f"  {key[0]} p{page_num}: error {e}")
+                    stats["failed"] += 1
+                    continue
+                if data is None:
+                    log(f"  {key[0]} p{page_num}: page out of range")
+                    stats["failed"] += 1
+                    continue
+                cache.put(key, data)
+                stats["rendered"] += 1
+                log(f"  {key[0]} p{page_num}: {seconds * 1000:.0f} ms, {len(data) / 1024:.0f} KiB")
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
@@ -39,21 +39,112 @@ window.addEventListener("DOMContentLoaded", () => {
   }
 
   // ✅ Render one or multiple images from server
-  function addImages(images) {
+  // thumbs/srcsets (optional, same order as images): the thumbnail loads first
+  // and is then swapped for the full image (see the "load" listener below)
+  function addImages(images, thumbs, srcsets) {
     if (!images) return;
 
     // allow single string or array
     const list = Array.isArray(images) ? images : [images];
+    const escape = (v) => String(v).replace(/"/g, "&quot;");
 
-    list.forEach((url) => {
+    list.forEach((url, i) => {
       if (!url) return;
-      const safeUrl = String(url).replace(/"/g, "&quot;");
-      chatBox.innerHTML += `<img src="${safeUrl}" class="formula-img" alt="formula"><br>`;
+      const safeUrl = escape(url);
+      const thumb = thumbs && thumbs[i];
+      const srcset = srcsets && srcsets[i];
+
+      if (thumb) {
+        chatBox.innerHTML +=
+          `<img src="${escape(thumb)}" data-full="${safeUrl}"` +
+          (srcset ? ` data-srcset="${escape(srcset)}"` : "") +
+          ` loading="lazy" class="formula-img" alt="formula"><br>`;
+      } else {
+        chatBox.innerHTML += `<img src="${safeUrl}" class="formula-img" alt="formula"><br>`;
+      }
     });
 
     chatBox.scrollTop = chatBox.scrollHeight;
   }
 
+  // Thumbnail shown: switch on srcset so the browser fetches the width it
+  // needs (or the plain full URL when there is no srcset). Listens on chatBox
+  // in the capture phase because addLine() re-creates the images. data-full
+  // stays for the modal; data-upgraded marks images already switched.
+  chatBox.addEventListener("load", (e) => {
+    const img = e.target;
+    if (!(img instanceof HTMLImageElement) || !img.dataset.full || img.dataset.upgraded) return;
+    const { full, srcset } = img.dataset;
+    img.dataset.upgraded = "1";
+    delete img.dataset.srcset;
+    if (srcset) {
+      img.sizes = "(max-width: 600px) 100vw, 600px";
+      img.srcset = srcset;
+    } else {
+      img.src = full;
+    }
+  }, true);
+
+  // WebP thumbnails when the browser can show them (sent in Accept for streaming)
+  const SUPPORTS_WEBP = (() => {
+    try {
+      return document.createElement("canvas").toDataURL("image/webp").startsWith("data:image/webp");
+    } catch (err) {
+      return false;
+    }
+  })();
+
+  // Streamed replies (Server-Sent Events over fetch): text first, then each
+  // slide as soon as the server has rendered it.
+  const CAN_STREAM = typeof ReadableStream !== "undefined" && typeof TextDecoder !== "undefined";
+
+  function showReply(data) {
+    // Explain (panel)
+    if (data.type === "explain") {
+      if (typeof showExplanation === "function") {
+        showExplanation(data.topic, explainText);
+      }
+      addLine("Bot", `Opened explanation for ${String(data.topic || "").toUpperCase()}.`);
+      return;
+    }
+
+    // Normal chat text
+    addLine("Bot", data.text || "");
+
+    // ✅ show images if provided by Flask
+    if (data.images) addImages(data.images, data.thumbs, data.srcsets);
+    if (data.image) addImages(data.image);
+  }
+
+  async function readStream(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let end;
+      while ((end = buffer.indexOf("\n\n")) >= 0) {
+        const block = buffer.slice(0, end);
+        buffer = buffer.slice(end + 2);
+
+        let event = "message";
+        let data = "";
+        block.split("\n").forEach((lineText) => {
+          if (lineText.startsWith("event: ")) event = lineText.slice(7);
+          else if (lineText.startsWith("data: ")) data += lineText.slice(6);
+        });
+
+        const parsed = data ? JSON.parse(data) : {};
+        if (event === "reply") showReply(parsed);
+        else if (event === "image") addImages([parsed.url], [parsed.thumb], [parsed.srcset]);
+      }
+    }
+  }
+
   async function sendChat() {
     const msg = chatInput.value.trim();
     if (!msg) return;
@@ -65,9 +156,12 @@ window.addEventListener("DOMContentLoaded", () => {
     try {
       res = await fetch("/chat", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(CAN_STREAM ? { Accept: "text/event-stream" + (SUPPORTS_WEBP ? ", image/webp" : "") } : {})
+        },
         credentials: "include", // ✅ IMPORTANT: keep Flask session
-        body: JSON.stringify({ message: msg })
+        body: JSON.stringify({ message: msg, stream: CAN_STREAM })
       });
     } catch (err) {
       console.error(err);
@@ -75,6 +169,17 @@ window.addEventListener("DOMContentLoaded", () => {
       return;
     }
 
+    const contentType = res.headers.get("Content-Type") || "";
+    if (res.body && contentType.startsWith("text/event-stream")) {
+      try {
+        await readStream(res);
+      } catch (err) {
+        console.error(err);
+        addLine("Bot", "⚠️ Connection lost while loading the reply.");
+      }
+      return;
+    }
+
     let data;
     try {
       data = await res.json();
@@ -84,21 +189,7 @@ window.addEventListener("DOMContentLoaded", () => {
       return;
     }
 
-    // Explain (panel)
-    if (data.type === "explain") {
-      if (typeof showExplanation === "function") {
-        showExplanation(data.topic, explainText);
-      }
-      addLine("Bot", `Opened explanation for ${String(data.topic || "").toUpperCase()}.`);
-      return;
-    }
-
-    // Normal chat text
-    addLine("Bot", data.text || "");
-
-    // ✅ show images if provided by Flask
-    if (data.images) addImages(data.images);
-    if (data.image) addImages(data.image);
+    showReply(data);
   }
 
   async function clearChat() {
@@ -487,7 +578,7 @@ window.addEventListener("DOMContentLoaded", () => {
     document.addEventListener("click", (e) => {
       if (e.target.classList && e.target.classList.contains("formula-img")) {
         imgModal.style.display = "flex";
-        imgModalContent.src = e.target.src;
+        imgModalContent.src = e.target.dataset.full || e.target.src;
       }
     });
 
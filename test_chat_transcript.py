@@ -0,0 +1,84 @@
+import json
+import os
+import random
+import tempfile
+
+import pytest
+
+# Fixed environment before app is imported: no startup report, no content or
+# slide-index polling, and an empty slide index so the fallback is the
+# noanswer intent.
+os.environ["STARTUP_REPORT"] = "0"
+os.environ["CONTENT_RELOAD_INTERVAL"] = "0"
+os.environ["SEARCH_RELOAD_INTERVAL"] = "0"
+os.environ["SEARCH_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(), "no_index.json.gz")
+os.environ.pop("CONVO_STATE_STORE", None)
+os.environ.pop("QUIZ_SHUFFLE", None)
+os.environ.pop("QUIZ_SAMPLE", None)
+
+import app as chatbot  # noqa: E402
+
+# ------------------- Recorded transcript -------------------
+# Replies to these messages, sent in order in one session with random.seed(i)
+# before message i, must stay byte-for-byte what chat_transcript.golden.json
+# holds. When recorded, every reply matched the pre-router code (commit
+# 2d5f801) except the "thumbs" of the four slide replies, which changed when
+# slide thumbnails were added. Regenerate the golden file with UPDATE_GOLDEN=1
+# only for an intended change in replies.
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_transcript.golden.json")
+
+TRANSCRIPT = [
+    # greetings and commands
+    "hi", "/topic", "/quiz", "/clear",
+    # topic pick by number, by name, and out of range / unknown
+    "/topic", "6", "/topic", "binary number system", "/topic", "99", "/topic", "xyz",
+    # quiz pick and answers (right, wrong, out of range), then a second category
+    "/quiz", "1", "1", "2", "3", "1", "2", "1", "/quiz", "6", "2", "4", "/clear",
+    "/quiz", "42", "/quiz", "10", "1", "/quiz", "3", "1", "1", "/clear",
+    # series / parallel and the yes/no formula follow-ups
+    "series", "yes", "parallel", "maybe", "no", "series", "no",
+    "parallel circuit", "yes", "/topic", "series", "yes", "seriesxyz",
+    # explain
+    "explain ohm", "explain and", "explain xyz", "explain",
+    # slide topics
+    "logic gates", "analogue electronics", "logicgates", "Logic Gates!",
+    "/topic", "full adder", "ok", "1", "2", "3", "4", "5",
+    # intents, fuzzy matches and the fallback
+    "what is a half adder", "thanks", "bye", "who are you", "de morgan", "k map",
+    "hello there", "2's complement", "binry", "", "   ", "qwertyuiop zxcv",
+]
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # Plain /static/ formula URLs, whether or not `flask build-assets` has run here.
+    saved = chatbot.asset_manifest
+    chatbot.asset_manifest = {}
+    ok, error = chatbot.content_store.reload()
+    assert ok, error
+    yield chatbot.app.test_client()
+    chatbot.asset_manifest = saved
+    chatbot.content_store.reload()
+
+
+def run_transcript(client):
+    replies = []
+    for i, message in enumerate(TRANSCRIPT):
+        random.seed(i)
+        r = client.post("/chat", json={"message": message})
+        replies.append({"message": message, "status": r.status_code, "reply": r.get_data(as_text=True)})
+    return replies
+
+
+def test_chat_transcript_matches_golden(client):
+    replies = run_transcript(client)
+    if os.environ.get("UPDATE_GOLDEN") == "1":
+        with open(GOLDEN_PATH, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(replies, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = json.load(f)
+
+    assert [g["message"] for g in golden] == TRANSCRIPT, "transcript changed; regenerate with UPDATE_GOLDEN=1"
+    for got, want in zip(replies, golden):
+        assert (got["status"], got["reply"]) == (want["status"], want["reply"]), got["message"]